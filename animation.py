@@ -0,0 +1,16 @@
+from settings import *
+
+class AnimationClock:
+    def __init__(self):
+        self.frame = 0
+        self.next_frame = 0
+
+    def tick(self, now):
+        if now < self.next_frame:
+            return False
+        self.next_frame = now + ANIMATION_INTERVAL
+        self.frame += 1
+        return True
+
+    def image(self, frames):
+        return frames[self.frame % len(frames)]
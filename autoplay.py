@@ -0,0 +1,73 @@
+from combat import hit_chance
+from quality import flood
+from settings import *
+import numpy as np
+
+class AutoPlayer:
+    def __init__(self, game, seed=None, margin=AUTOPLAY_HEALTH_MARGIN):
+        self.game = game
+        self.rng = np.random.default_rng(seed)
+        self.margin = margin
+        self.key = None
+        self.distances = None
+
+    def goal(self):
+        game = self.game
+        level = game.level
+        if not game.player.key:
+            for pickup in game.grid["PICKUPS"]:
+                if pickup.type == 1:
+                    return int(pickup.pos.x), int(pickup.pos.y)
+            return None
+        exits = np.argwhere(level.tiles == TILE_EXIT)
+        if not len(exits):
+            return None
+        y, x = exits[0].tolist()
+        return x + level.left, y + level.top
+
+    def worth_fighting(self, enemy):
+        player = self.game.player
+        dealt = player.damage * min(hit_chance(player.accuracy, enemy.hit_resistance), 1)
+        taken = enemy.damage * min(hit_chance(enemy.accuracy, player.hit_resistance), 1)
+        if dealt <= 0:
+            return False
+        return np.ceil(enemy.health / dealt) * taken < player.health - self.margin
+
+    def plan(self, goal, avoid):
+        level = self.game.level
+        key = (level, goal, avoid)
+        if key != self.key:
+            self.key = key
+            walkable = level.tiles == TILE_FLOOR
+            for x, y in avoid:
+                walkable[y - level.top, x - level.left] = False
+            self.distances = flood(walkable, (goal[1] - level.top, goal[0] - level.left))
+        return self.distances
+
+    def distance(self, distances, x, y):
+        level = self.game.level
+        if not level.in_bounds(x, y):
+            return -1
+        return int(distances[y - level.top, x - level.left])
+
+    def step(self, distances, x, y):
+        distance = self.distance(distances, x, y)
+        if distance <= 0:
+            return None
+        for dx, dy in DIRECTIONS:
+            if 0 <= self.distance(distances, x + dx, y + dy) < distance:
+                return dx, dy
+        return None
+
+    def choose(self):
+        game = self.game
+        x, y = int(game.player.pos.x), int(game.player.pos.y)
+        goal = self.goal()
+        if goal:
+            avoid = frozenset((int(enemy.pos.x), int(enemy.pos.y)) for enemy in game.grid["ENEMIES"] if not self.worth_fighting(enemy))
+            step = self.step(self.plan(goal, avoid), x, y)
+            if step is None and avoid:
+                step = self.step(self.plan(goal, frozenset()), x, y)
+            if step:
+                return step
+        return DIRECTIONS[self.rng.integers(len(DIRECTIONS))]
@@ -0,0 +1,130 @@
+from combat import hit_chance, hits, enemy_stats, KILL_BONUS_TABLE
+from settings import *
+import numpy as np
+import argparse
+import itertools
+import json
+import time
+import sys
+
+STATS = ["damage", "max_health", "hit_resistance", "accuracy", "lifesteal", "stage"]
+
+def simulate(player, enemy_types, rng, max_rounds=1000):
+    count, chain = enemy_types.shape
+    damage = player["damage"].astype(np.float64)
+    max_health = player["max_health"].astype(np.float64)
+    health = max_health.copy()
+    hit_resistance = player["hit_resistance"].astype(np.float64)
+    accuracy = player["accuracy"].astype(np.float64)
+    lifesteal = player["lifesteal"].astype(np.float64)
+    stage = player["stage"]
+    fight = np.zeros(count, dtype=np.int64)
+    enemy = enemy_stats(enemy_types[:, 0], stage)
+    fights = np.arange(count)
+    rounds = np.zeros(count, dtype=np.int64)
+    first_kill = np.zeros(count, dtype=np.int64)
+    kills = np.zeros(count, dtype=np.int64)
+    final_health = np.zeros(count)
+    died = np.zeros(count, dtype=bool)
+    for turn in range(1, max_rounds + 1):
+        if not len(fights):
+            break
+        chance = hit_chance(accuracy, enemy[:, 2])
+        enemy[:, 1] -= np.where(hits(chance, rng.random(len(fights))), damage, 0)
+        killed = enemy[:, 1] < 0.01
+        bonus = KILL_BONUS_TABLE[enemy_types[fights, fight]] * killed[:, None]
+        health = np.minimum(health + bonus[:, 0], max_health)
+        lifesteal += bonus[:, 1]
+        accuracy += bonus[:, 2]
+        damage += bonus[:, 3]
+        hit_resistance += bonus[:, 4]
+        health = np.minimum(health + lifesteal, max_health)
+        chance = hit_chance(enemy[:, 3], hit_resistance)
+        health -= np.where(hits(chance, rng.random(len(fights))), enemy[:, 0], 0)
+        first_kill[fights[killed & (fight == 0)]] = turn
+        kills[fights[killed]] += 1
+        fight += killed
+        dead = health < 1
+        done = dead | (fight >= chain)
+        rounds[fights[done]] = turn
+        final_health[fights[done]] = health[done]
+        died[fights[dead]] = True
+        advance = killed & ~done
+        if advance.any():
+            enemy[advance] = enemy_stats(enemy_types[fights[advance], fight[advance]], stage[advance])
+        keep = ~done
+        fights = fights[keep]
+        damage, max_health, health = damage[keep], max_health[keep], health[keep]
+        hit_resistance, accuracy, lifesteal = hit_resistance[keep], accuracy[keep], lifesteal[keep]
+        stage, fight, enemy = stage[keep], fight[keep], enemy[keep]
+    rounds[fights] = max_rounds
+    final_health[fights] = health
+    return {
+        "rounds" : rounds,
+        "time_to_kill" : first_kill,
+        "kills" : kills,
+        "health_lost" : player["max_health"] - final_health,
+        "died" : died,
+        "unresolved" : np.isin(np.arange(count), fights)
+    }
+
+def grid(values):
+    names = list(values)
+    cells = list(itertools.product(*(values[name] for name in names)))
+    return [dict(zip(names, cell)) for cell in cells]
+
+def summarize(result, select):
+    time_to_kill = result["time_to_kill"][select]
+    time_to_kill = time_to_kill[time_to_kill > 0]
+    health_lost = result["health_lost"][select]
+    summary = {
+        "fights" : int(select.sum()),
+        "death_probability" : float(result["died"][select].mean()),
+        "unresolved" : float(result["unresolved"][select].mean()),
+        "mean_kills" : float(result["kills"][select].mean()),
+        "health_lost_mean" : float(health_lost.mean()),
+        "health_lost_p95" : float(np.percentile(health_lost, 95))
+    }
+    if len(time_to_kill):
+        summary["time_to_kill_mean"] = float(time_to_kill.mean())
+        summary["time_to_kill_p50"] = float(np.percentile(time_to_kill, 50))
+        summary["time_to_kill_p95"] = float(np.percentile(time_to_kill, 95))
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser(description="Monte Carlo combat simulator for balance sweeps.")
+    parser.add_argument("--fights", type=int, default=100000, help="fights per grid cell")
+    parser.add_argument("--chain", type=int, default=1, help="enemies fought in a row, carrying health and kill bonuses")
+    parser.add_argument("--enemy-types", type=int, nargs="+", default=list(range(len(ENEMY_STATS))))
+    parser.add_argument("--damage", type=float, nargs="+", default=[PLAYER_STATS[0]])
+    parser.add_argument("--max-health", type=float, nargs="+", default=[PLAYER_STATS[1]])
+    parser.add_argument("--hit-resistance", type=float, nargs="+", default=[PLAYER_STATS[2]])
+    parser.add_argument("--accuracy", type=float, nargs="+", default=[PLAYER_STATS[3]])
+    parser.add_argument("--lifesteal", type=float, nargs="+", default=[0])
+    parser.add_argument("--stage", type=int, nargs="+", default=[0])
+    parser.add_argument("--max-rounds", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    cells = grid({name : getattr(args, name) for name in STATS})
+    cell = np.repeat(np.arange(len(cells)), args.fights)
+    player = {name : np.array([values[name] for values in cells])[cell] for name in STATS}
+    enemy_types = rng.choice(args.enemy_types, size=(len(cell), args.chain))
+    start = time.perf_counter()
+    result = simulate(player, enemy_types, rng, args.max_rounds)
+    elapsed = time.perf_counter() - start
+
+    output = open(args.output, "w") if args.output else None
+    for i, values in enumerate(cells):
+        summary = dict(values, **summarize(result, cell == i))
+        if output:
+            output.write(json.dumps(summary) + "\n")
+        print(" ".join("{}={:g}".format(key, value) for key, value in summary.items()))
+    if output:
+        output.close()
+    print("{} fights in {:.2f}s ({:.0f} fights/s)".format(len(cell), elapsed, len(cell) / elapsed))
+
+if __name__ == "__main__":
+    sys.exit(main())
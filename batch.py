@@ -0,0 +1,56 @@
+from settings import DIRECTIONS
+from main import Game
+import multiprocessing
+import argparse
+import random
+import json
+import sys
+
+game = None
+
+def init_worker():
+    global game
+    game = Game(headless=True)
+
+def play(task):
+    seed, turns = task
+    policy = random.Random(seed)
+    game.new(seed)
+    state = game.state()
+    turn = 0
+    while turn < turns and state["playing"]:
+        state = game.move(*policy.choice(DIRECTIONS))
+        turn += 1
+    state["seed"] = seed
+    state["turns"] = turn
+    return state
+
+def main():
+    parser = argparse.ArgumentParser(description="Play seeded headless games in parallel.")
+    parser.add_argument("--games", type=int, default=1000)
+    parser.add_argument("--turns", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    tasks = [(seed, args.turns) for seed in range(args.seed, args.seed + args.games)]
+    output = open(args.output, "w") if args.output else None
+    results = []
+    with multiprocessing.Pool(args.processes, initializer=init_worker) as pool:
+        for result in pool.imap_unordered(play, tasks, chunksize=8):
+            results.append(result)
+            if output:
+                output.write(json.dumps(result) + "\n")
+    if output:
+        output.close()
+
+    deaths = sum(1 for result in results if not result["playing"])
+    print("games: {}".format(len(results)))
+    print("deaths: {} ({:.1%})".format(deaths, deaths / len(results)))
+    print("mean stage: {:.2f}".format(sum(result["stage"] for result in results) / len(results)))
+    print("mean score: {:.2f}".format(sum(result["score"] for result in results) / len(results)))
+    print("mean turns: {:.2f}".format(sum(result["turns"] for result in results) / len(results)))
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,138 @@
+from dungeon import DungeonGenerator
+from settings import *
+import numpy as np
+import tracemalloc
+import argparse
+import platform
+import json
+import time
+import sys
+
+PHASES = ["generate_floor", "generate_walls", "add_coins", "add_enemies", "place_corner_floors"]
+STEPS = [1000, 10000, 100000, 1000000]
+
+def counts(level):
+    return {
+        "floor" : int(np.count_nonzero(level.tiles == TILE_FLOOR)),
+        "walls" : int(np.count_nonzero((level.tiles == TILE_WALL) | (level.tiles == TILE_EXIT))),
+        "pickups" : len(level.pickups),
+        "enemies" : len(level.enemies)
+    }
+
+def run_phases(generator, steps, seed, trace=False):
+    if hasattr(generator, "level"):
+        del generator.level
+    generator.max_steps = steps
+    generator.reset(seed)
+    samples = {}
+    corner_floors = None
+    for phase in PHASES:
+        args = (corner_floors,) if phase == "place_corner_floors" else ()
+        if trace:
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        result = getattr(generator, phase)(*args)
+        elapsed = time.perf_counter() - start
+        if phase == "generate_walls":
+            corner_floors = result
+        if trace:
+            samples[phase] = tracemalloc.get_traced_memory()[1] - base
+        else:
+            samples[phase] = {"time" : elapsed, "counts" : counts(generator.level)}
+    return samples
+
+def benchmark(steps_list, seeds):
+    generator = DungeonGenerator()
+    results = []
+    for steps in steps_list:
+        times = {phase : [] for phase in PHASES}
+        memory = {phase : [] for phase in PHASES}
+        phase_counts = {}
+        for seed in seeds:
+            for phase, sample in run_phases(generator, steps, seed).items():
+                times[phase].append(sample["time"])
+                phase_counts[phase] = sample["counts"]
+            tracemalloc.start()
+            for phase, peak in run_phases(generator, steps, seed, trace=True).items():
+                memory[phase].append(peak)
+            tracemalloc.stop()
+        for phase in PHASES:
+            results.append({
+                "phase" : phase,
+                "max_steps" : steps,
+                "seeds" : len(seeds),
+                "time_median" : float(np.median(times[phase])),
+                "time_min" : min(times[phase]),
+                "time_max" : max(times[phase]),
+                "peak_memory" : max(memory[phase]),
+                "counts" : phase_counts[phase]
+            })
+        print_rows(results[-len(PHASES):])
+    return results
+
+def scaling(results):
+    exponents = {}
+    for phase in PHASES:
+        rows = [row for row in results if row["phase"] == phase and row["time_median"] > 0]
+        if len(rows) > 1:
+            x = np.log([row["max_steps"] for row in rows])
+            y = np.log([row["time_median"] for row in rows])
+            exponents[phase] = float(np.polyfit(x, y, 1)[0])
+    return exponents
+
+def compare(current, baseline, time_tolerance, exponent_tolerance, min_time):
+    failures = []
+    rows = {(row["phase"], row["max_steps"]) : row for row in baseline["results"]}
+    for row in current["results"]:
+        old = rows.get((row["phase"], row["max_steps"]))
+        if old and max(old["time_median"], row["time_median"]) > min_time:
+            ratio = row["time_median"] / old["time_median"]
+            if ratio > time_tolerance:
+                failures.append("{} @ {} steps: {:.2f}x slower than baseline".format(row["phase"], row["max_steps"], ratio))
+    for phase, exponent in current["scaling"].items():
+        old = baseline["scaling"].get(phase)
+        if old is not None and exponent > old + exponent_tolerance:
+            failures.append("{}: scaling exponent {:.2f} (baseline {:.2f})".format(phase, exponent, old))
+    return failures
+
+def print_rows(rows):
+    for row in rows:
+        print("{:<20} {:>8} steps {:>10.2f} ms {:>10.2f} MiB  {}".format(
+            row["phase"], row["max_steps"], row["time_median"] * 1000,
+            row["peak_memory"] / 2 ** 20, row["counts"]))
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark dungeon generation phases.")
+    parser.add_argument("--steps", type=int, nargs="+", default=STEPS)
+    parser.add_argument("--seeds", type=int, default=5)
+    parser.add_argument("--output", default=None)
+    parser.add_argument("--baseline", default=None)
+    parser.add_argument("--time-tolerance", type=float, default=1.5)
+    parser.add_argument("--exponent-tolerance", type=float, default=0.25)
+    parser.add_argument("--min-time", type=float, default=0.005, help="ignore phases faster than this many seconds")
+    args = parser.parse_args()
+
+    results = benchmark(args.steps, list(range(args.seeds)))
+    report = {
+        "python" : platform.python_version(),
+        "numpy" : np.__version__,
+        "vectorized" : GENERATOR_VECTORIZED,
+        "results" : results,
+        "scaling" : scaling(results)
+    }
+    for phase, exponent in report["scaling"].items():
+        print("{:<20} scales as steps^{:.2f}".format(phase, exponent))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            failures = compare(report, json.load(f), args.time_tolerance, args.exponent_tolerance, args.min_time)
+        for failure in failures:
+            print("REGRESSION: " + failure)
+        return 1 if failures else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
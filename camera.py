@@ -3,17 +3,24 @@ import pygame
 
 class Camera:
     def __init__(self):
-        self.camera = pygame.Rect(0, 0, SCREEN_WIDTH, SCREEN_HEIGHT)
-        self.width = SCREEN_WIDTH
-        self.height = SCREEN_HEIGHT
-        self.calculate_offset(SCREEN_WIDTH, SCREEN_HEIGHT, SPRITE_SIZE)
+        self.camera = pygame.Rect(0, 0, RENDER_WIDTH, RENDER_HEIGHT)
+        self.width = RENDER_WIDTH
+        self.height = RENDER_HEIGHT
+        self.calculate_offset(RENDER_WIDTH, RENDER_HEIGHT, TILE_SIZE)
 
     def calculate_offset(self, w, h, ts):
         self.offsetX = int((w - ts) / 2)
         self.offsetY = int((h - ts) / 2)
 
     def apply(self, entity):
-        return entity.rect.move(self.camera.topleft)
+        return (entity.rect.x + self.camera.x, entity.rect.y + self.camera.y)
+
+    def viewport(self):
+        left = -self.camera.x // TILE_SIZE
+        top = -self.camera.y // TILE_SIZE
+        right = (-self.camera.x + self.width - 1) // TILE_SIZE + 1
+        bottom = (-self.camera.y + self.height - 1) // TILE_SIZE + 1
+        return left, top, right, bottom
 
     def update(self, target):
         self.camera.x = -target.rect.x + self.offsetX
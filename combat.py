@@ -0,0 +1,14 @@
+from settings import *
+import numpy as np
+
+ENEMY_STAT_TABLE = np.array(ENEMY_STATS, dtype=np.float64)
+KILL_BONUS_TABLE = np.array(KILL_BONUS, dtype=np.float64)
+
+def hit_chance(accuracy, hit_resistance):
+    return np.maximum(accuracy - hit_resistance + BASE_HIT_CHANCE, MIN_HIT_CHANCE)
+
+def hits(chance, roll):
+    return (chance > 1) | (roll < chance)
+
+def enemy_stats(enemy_type, stage):
+    return ENEMY_STAT_TABLE[enemy_type] + np.expand_dims(stage, -1) * ENEMY_STAGE_SCALING
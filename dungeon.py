@@ -1,149 +1,247 @@
-import pygame
-import random
-import sprites
-import time
+from spatial import scatter
+from level import Level
+from settings import *
+import numpy as np
 
-class DungeonGenerator:
-    def __init__(self, game):
-        self.game = game
+DIRECTION_X = np.array([0, 1, 0, -1])
+DIRECTION_Y = np.array([-1, 0, 1, 0])
+NEIGHBOUR_OFFSETS = [(dx, dy) for dy in range(-1, 2) for dx in range(-1, 2)]
+
+def shifted_neighbours(grid):
+    padded = np.pad(grid, 1)
+    height, width = grid.shape
+    return (
+        padded[0:height, 1:width + 1],
+        padded[1:height + 1, 2:width + 2],
+        padded[2:height + 2, 1:width + 1],
+        padded[1:height + 1, 0:width]
+    )
 
-    def generate(self):
-        self.coin_spawn_chance = 0.75
+class DungeonGenerator:
+    def __init__(self, progress=None):
+        self.progress = progress
+        self.spawn = (0, 0)
+        self.coin_spawn_chance = COIN_SPAWN_CHANCE
+        self.coin_min_distance = COIN_MIN_DISTANCE
         self.max_steps = 1000
         self.floor_type = 3
         self.wall_type = 0
-        self.enemy_spawn_chance = 0.1
-        self.enemy_min_distance = 10
-        self.exit_placed = False
+        self.enemy_spawn_chance = ENEMY_SPAWN_CHANCE
+        self.enemy_spawn_chance_per_stage = ENEMY_SPAWN_CHANCE_PER_STAGE
+        self.enemy_spawn_chance_max = ENEMY_SPAWN_CHANCE_MAX
+        self.enemy_min_distance = ENEMY_MIN_DISTANCE
+        self.vectorized = GENERATOR_VECTORIZED
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for name in ("progress", "rng", "level", "floor_cells", "wall_cells", "occupied", "walker"):
+            state.pop(name, None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.progress = None
 
-        self.game.title_screen("Placing floor", 500)
+    def generate(self, seed=None, stage=0):
+        self.reset(seed, stage)
+
+        self.report("Placing floor", 500)
         self.generate_floor()
         
-        self.game.title_screen("Placing walls")
+        self.report("Placing walls")
         corner_floor_coords = self.generate_walls()
         
-        self.game.title_screen("Dropping coins", 500)
+        self.report("Dropping coins", 500)
         self.add_coins()
 
-        self.game.title_screen("Spawning monsters", 500)
+        self.report("Spawning monsters", 500)
         self.add_enemies()
 
-        self.game.title_screen("Some finishing touches", 1000)
+        self.report("Some finishing touches", 1000)
         self.place_corner_floors(corner_floor_coords)
+        return self.level
+
+    def report(self, text, wait=0):
+        if self.progress:
+            self.progress(text, wait)
+
+    def reset(self, seed=None, stage=0):
+        self.rng = np.random.default_rng(seed)
+        self.stage = stage
+        self.exit_placed = False
+        self.occupied = {self.spawn}
 
     def generate_floor(self):
+        if self.vectorized:
+            return self.generate_floor_vectorized()
         self.step = 0
-        self.walker = Walker(0, 0, 1)
+        self.walker = Walker(self.spawn[0], self.spawn[1], 1, self.rng)
+        cells = []
         while self.step < self.max_steps:
-            self.place_floor(self.walker.x, self.walker.y)
+            cells.append((self.walker.x, self.walker.y))
             self.walker.step()
             self.step += 1
+        self.floor_cells = list(dict.fromkeys(cells))
+        self.level = Level.around([x for x, _ in self.floor_cells], [y for _, y in self.floor_cells])
+        self.level.spawn = self.spawn
+        for x, y in self.floor_cells:
+            self.place_floor(x, y)
+
+    def generate_floor_vectorized(self):
+        xs, ys = Walker(self.spawn[0], self.spawn[1], 1, self.rng).walk(self.max_steps)
+        self.level = Level.around(xs, ys)
+        self.level.spawn = self.spawn
+        keys = (ys - self.level.top) * self.level.width + (xs - self.level.left)
+        _, first = np.unique(keys, return_index=True)
+        first.sort()
+        xs, ys = xs[first], ys[first]
+        self.floor_cells = list(zip(xs.tolist(), ys.tolist()))
+        self.level.tiles[ys - self.level.top, xs - self.level.left] = TILE_FLOOR
+        self.level.floor_variant[ys - self.level.top, xs - self.level.left] = self.floor_type
 
     def generate_walls(self):
+        if self.vectorized:
+            return self.generate_walls_vectorized()
         corner_floors = []
-        for floor in self.game.layers["FLOOR"]:
-            for y in range(int(floor.pos.y - 1), int(floor.pos.y + 2)):
-                for x in range(int(floor.pos.x - 1), int(floor.pos.x + 2)):
-                    if not (x == int(floor.pos.x) and y == int(floor.pos.y)):
-                        if not self.get_sprites_at([self.game.layers["WALLS"]], x, y) and not self.get_sprites_at([self.game.layers["FLOOR"]], x, y):
-                            sprites.Wall(self.game, x, y, self.wall_type)
-                            a, b, c, d = self.get_neighbours(self.game.layers["FLOOR"], x, y)
-                            if a+b+c+d:
-                                corner_floors.append((x, y))
-        for wall in self.game.layers["WALLS"]:
-            top, right, bottom, left = self.get_neighbours(self.game.layers["WALLS"], wall.pos.x, wall.pos.y)
-            if not self.place_exit(wall, (top, right, bottom, left)):
-                wall.update_sprite(top + right * 2 + bottom * 4 + left * 8)
+        self.wall_cells = []
+        level = self.level
+        for floor_x, floor_y in self.floor_cells:
+            for y in range(floor_y - 1, floor_y + 2):
+                for x in range(floor_x - 1, floor_x + 2):
+                    if level.tile_at(x, y) == TILE_EMPTY:
+                        level.change_wall_type(x, y, self.wall_type)
+                        self.wall_cells.append((x, y))
+                        a, b, c, d = self.get_neighbours(level.is_floor, x, y)
+                        if a+b+c+d:
+                            corner_floors.append((x, y))
+        for x, y in self.wall_cells:
+            top, right, bottom, left = self.get_neighbours(level.is_wall, x, y)
+            if not self.place_exit(x, y, (top, right, bottom, left)):
+                level.set_wall_variant(x, y, top + right * 2 + bottom * 4 + left * 8)
+        self.place_fallback_exit()
         return corner_floors
 
+    def generate_walls_vectorized(self):
+        level = self.level
+        floor = level.tiles == TILE_FLOOR
+        padded = np.pad(floor, 1)
+        near_floor = np.zeros_like(floor)
+        for dx, dy in NEIGHBOUR_OFFSETS:
+            near_floor |= padded[1 + dy:1 + dy + level.height, 1 + dx:1 + dx + level.width]
+        wall = near_floor & ~floor
+        level.tiles[wall] = TILE_EXIT if self.wall_type == 1 else TILE_WALL
+
+        floor_xs = np.array([x for x, _ in self.floor_cells]) - level.left
+        floor_ys = np.array([y for _, y in self.floor_cells]) - level.top
+        xs = (floor_xs[:, None] + np.array([dx for dx, _ in NEIGHBOUR_OFFSETS])).ravel()
+        ys = (floor_ys[:, None] + np.array([dy for _, dy in NEIGHBOUR_OFFSETS])).ravel()
+        keep = wall[ys, xs]
+        xs, ys = xs[keep], ys[keep]
+        _, first = np.unique(ys * level.width + xs, return_index=True)
+        first.sort()
+        xs, ys = xs[first], ys[first]
+        self.wall_cells = list(zip((xs + level.left).tolist(), (ys + level.top).tolist()))
+
+        top, right, bottom, left = shifted_neighbours(wall)
+        level.wall_variant[wall] = (top + right * 2 + bottom * 4 + left * 8)[wall]
+        exits = np.flatnonzero((right & left & ~top & ~bottom)[ys, xs])
+        if len(exits):
+            self.exit_placed = True
+            level.change_wall_type(xs[exits[0]] + level.left, ys[exits[0]] + level.top, 1)
+        self.place_fallback_exit()
+
+        top, right, bottom, left = shifted_neighbours(floor)
+        corners = np.flatnonzero((top | right | bottom | left)[ys, xs])
+        return list(zip((xs[corners] + level.left).tolist(), (ys[corners] + level.top).tolist()))
+
+    def wall_neighbour_counts(self):
+        level = self.level
+        wall = (level.tiles == TILE_WALL) | (level.tiles == TILE_EXIT)
+        top, right, bottom, left = shifted_neighbours(wall)
+        counts = top.astype(np.uint8) + right + bottom + left
+        xs = np.array([x for x, _ in self.floor_cells]) - level.left
+        ys = np.array([y for _, y in self.floor_cells]) - level.top
+        return counts[ys, xs].tolist()
+
     def add_enemies(self):
-        for floor in self.game.layers["FLOOR"]:
-            a, b, c, d = self.get_neighbours(self.game.layers["WALLS"], floor.pos.x, floor.pos.y)
-            if a + b + c + d == 0 and not self.get_sprites_at([self.game.layers["ENEMIES"], self.game.layers["PLAYER"], self.game.layers["PICKUPS"]], floor.pos.x, floor.pos.y):
-                if random.random() < self.enemy_spawn_chance:
-                    self.place_enemy(floor.pos.x, floor.pos.y)
+        cells = [cell for cell, walls in zip(self.floor_cells, self.wall_neighbour_counts()) if walls == 0 and cell not in self.occupied]
+        chance = min(self.enemy_spawn_chance + self.stage * self.enemy_spawn_chance_per_stage, self.enemy_spawn_chance_max)
+        placed = scatter(self.rng, cells, chance, self.enemy_min_distance)
+        for (x, y), enemy_type in zip(placed, self.rng.integers(0, 4, size=len(placed)).tolist()):
+            self.level.enemies.append((x, y, enemy_type))
+            self.occupied.add((x, y))
 
-    def place_exit(self, wall, neihbours):
+    def place_exit(self, x, y, neihbours):
         top, right, bottom, left = neihbours
         if not self.exit_placed:
             if not top and not bottom and right and left:
                 self.exit_placed = True
-                wall.change_type(1)
+                self.level.change_wall_type(x, y, 1)
                 return True
         return False
 
-
-    def place_enemy(self, x, y):
-        for enemy in self.game.layers["ENEMIES"]:
-            if self.distance_squared((x, y), (enemy.pos.x, enemy.pos.y)) < self.enemy_min_distance:
-                return
-        enemy_type = random.randint(0, 3)
-        sprites.Enemy(self.game, x, y, enemy_type)
+    def place_fallback_exit(self):
+        if self.exit_placed:
+            return
+        level = self.level
+        top, right, bottom, left = shifted_neighbours(level.tiles == TILE_FLOOR)
+        ys, xs = np.nonzero((level.tiles == TILE_WALL) & (top | right | bottom | left))
+        if not len(xs):
+            return
+        xs, ys = xs + level.left, ys + level.top
+        far = np.argmax((xs - self.spawn[0]) ** 2 + (ys - self.spawn[1]) ** 2)
+        self.exit_placed = True
+        level.change_wall_type(xs[far], ys[far], 1)
 
     def add_coins(self):
-        for floor in self.game.layers["FLOOR"]:
-            if floor.pos.x != 0 and floor.pos.y != 0:
-                a, b, c, d = self.get_neighbours(self.game.layers["WALLS"], floor.pos.x, floor.pos.y)
-                if a + b + c + d == 3 and random.random() < self.coin_spawn_chance and not self.get_sprites_at([self.game.layers["PICKUPS"]], floor.pos.x, floor.pos.y):
-                    self.place_coin(floor.pos.x, floor.pos.y)
-        index = len(self.game.layers["PICKUPS"]) - 1
-        self.game.layers["PICKUPS"].sprites()[index].change_type(1)
+        cells = [(x, y) for (x, y), walls in zip(self.floor_cells, self.wall_neighbour_counts()) if x != 0 and y != 0 and walls == 3 and (x, y) not in self.occupied]
+        for x, y in scatter(self.rng, cells, self.coin_spawn_chance, self.coin_min_distance):
+            self.place_coin(x, y)
+        if not self.level.pickups:
+            self.place_fallback_key()
+            return
+        x, y, _ = self.level.pickups[-1]
+        self.level.pickups[-1] = (x, y, 1)
+
+    def place_fallback_key(self):
+        for x, y in reversed(self.floor_cells):
+            if (x, y) not in self.occupied:
+                self.level.pickups.append((x, y, 1))
+                self.occupied.add((x, y))
+                return
 
     def place_coin(self, x, y):
-        sprites.Pickup(self.game, x, y, 0)
+        self.level.pickups.append((x, y, 0))
+        self.occupied.add((x, y))
 
     def place_floor(self, x, y):
-        sprites.Floor(self.game, x, y, self.floor_type)
+        self.level.set_tile(x, y, TILE_FLOOR)
+        self.level.set_floor_variant(x, y, self.floor_type)
 
     def place_corner_floors(self, coords):
-        for coord in coords:
-            self.place_floor(*coord)
-
-    def get_neighbours(self, layer, x, y):
-        count = 0
-        top, right, bottom, left = 0, 0, 0, 0
-        for el in layer:
-            if count > 3:
-                break
-            if el.pos.x == x and el.pos.y == y - 1:
-                top = 1
-                count += 1
-            elif el.pos.x == x + 1 and el.pos.y == y:
-                right = 1
-                count += 1
-            elif el.pos.x == x and el.pos.y == y + 1:
-                bottom = 1
-                count += 1
-            elif el.pos.x == x - 1 and el.pos.y == y:
-                left = 1
-                count += 1
-        return (top, right, bottom, left)
-
-    def get_sprites_at(self, layers, x, y):
-        sprites = []
-        for layer in layers:
-            for sprite in layer:
-                if sprite.pos.x == x and sprite.pos.y == y:
-                    sprites.append(sprite)
-        return sprites
-
-    def distance_squared(self, pos1, pos2):
-        x1, y1 = pos1
-        x2, y2 = pos2
-        delta_x = x2 - x1
-        delta_y = y2 - y1
-        return delta_x * delta_x + delta_y + delta_y
+        for x, y in coords:
+            self.level.set_floor_variant(x, y, self.floor_type)
+
+    def get_neighbours(self, test, x, y):
+        return (
+            1 if test(x, y - 1) else 0,
+            1 if test(x + 1, y) else 0,
+            1 if test(x, y + 1) else 0,
+            1 if test(x - 1, y) else 0
+        )
 
 class Walker:
-    def __init__(self, x, y, turn_chance):
+    def __init__(self, x, y, turn_chance, rng):
         self.x = x
         self.y = y
         self.turn_chance = turn_chance
-        self.dir = random.randint(0, 3)
+        self.rng = rng
+        self.dir = int(rng.random() * 4)
 
     def step(self):
-        if random.random() < self.turn_chance:
-            self.dir = random.randint(0, 3)
+        turn, pick = self.rng.random(2)
+        if turn < self.turn_chance:
+            self.dir = int(pick * 4)
         if self.dir == 0:
             self.y -= 1
         elif self.dir == 1:
@@ -153,5 +251,17 @@ class Walker:
         else:
             self.x -= 1
 
+    def walk(self, steps):
+        rolls = self.rng.random((steps, 2))
+        turns = np.where(rolls[:, 0] < self.turn_chance, np.arange(steps), -1)
+        np.maximum.accumulate(turns, out=turns)
+        dirs = np.where(turns >= 0, (rolls[turns, 1] * 4).astype(int), self.dir)
+        xs = self.x + np.concatenate(([0], np.cumsum(DIRECTION_X[dirs[:-1]])))
+        ys = self.y + np.concatenate(([0], np.cumsum(DIRECTION_Y[dirs[:-1]])))
+        self.dir = int(dirs[-1])
+        self.x = int(xs[-1] + DIRECTION_X[self.dir])
+        self.y = int(ys[-1] + DIRECTION_Y[self.dir])
+        return xs, ys
+
     def spawn_new(self, turn_chance):
-        return Walker(self.x, self.y, turn_chance)
+        return Walker(self.x, self.y, turn_chance, self.rng)
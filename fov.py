@@ -0,0 +1,83 @@
+from collections import OrderedDict
+from fractions import Fraction
+from level import shift_grid
+from settings import *
+import numpy as np
+import math
+
+class FieldOfView:
+    def __init__(self, radius=FOV_RADIUS):
+        self.radius = radius
+        self.level = None
+        self.target = None
+        self.visible = frozenset()
+        self.explored = None
+        self.cache = OrderedDict()
+
+    def update(self, level, x, y):
+        x, y = int(x), int(y)
+        if level is not self.level:
+            self.level = level
+            self.origin = (level.left, level.top)
+            self.target = None
+            self.explored = np.zeros((level.height, level.width), dtype=bool)
+            self.cache.clear()
+        elif (level.left, level.top) != self.origin:
+            self.explored = shift_grid(self.explored, level.left - self.origin[0], level.top - self.origin[1], False)
+            self.origin = (level.left, level.top)
+            self.target = None
+        if (x, y) == self.target:
+            return
+        self.target = (x, y)
+        if self.target in self.cache:
+            self.cache.move_to_end(self.target)
+            self.visible = self.cache[self.target]
+        else:
+            self.visible = frozenset(self.cast(x, y))
+            self.cache[self.target] = self.visible
+            if len(self.cache) > FOV_CACHE_SIZE:
+                self.cache.popitem(last=False)
+        cells = np.array([cell for cell in self.visible if level.in_bounds(*cell)], dtype=np.int64).reshape(-1, 2)
+        self.explored[cells[:, 1] - level.top, cells[:, 0] - level.left] = True
+
+    def is_visible(self, x, y):
+        return (int(x), int(y)) in self.visible
+
+    def is_explored(self, x, y):
+        x, y = int(x), int(y)
+        return self.level.in_bounds(x, y) and self.explored[y - self.level.top, x - self.level.left]
+
+    def cast(self, x, y):
+        level = self.level
+        radius = self.radius
+        left = x - radius - 1
+        top = y - radius - 1
+        size = radius * 2 + 3
+        window = [[not level.is_floor(left + i, top + j) for i in range(size)] for j in range(size)]
+        visible = {(x, y)}
+        transforms = [
+            lambda depth, column: (x + column, y - depth),
+            lambda depth, column: (x + depth, y + column),
+            lambda depth, column: (x + column, y + depth),
+            lambda depth, column: (x - depth, y + column)
+        ]
+        for transform in transforms:
+            rows = [(1, Fraction(-1), Fraction(1))]
+            while rows:
+                depth, start_slope, end_slope = rows.pop()
+                if depth > radius:
+                    continue
+                previous = None
+                for column in range(math.floor(depth * start_slope + Fraction(1, 2)), math.ceil(depth * end_slope - Fraction(1, 2)) + 1):
+                    cell_x, cell_y = transform(depth, column)
+                    wall = window[cell_y - top][cell_x - left]
+                    if wall or depth * start_slope <= column <= depth * end_slope:
+                        visible.add((cell_x, cell_y))
+                    if previous is True and not wall:
+                        start_slope = Fraction(2 * column - 1, 2 * depth)
+                    if previous is False and wall:
+                        rows.append((depth + 1, start_slope, Fraction(2 * column - 1, 2 * depth)))
+                    previous = wall
+                if previous is False:
+                    rows.append((depth + 1, start_slope, end_slope))
+        return visible
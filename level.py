@@ -0,0 +1,63 @@
+from settings import *
+import numpy as np
+
+def shift_grid(grid, dx, dy, fill):
+    shifted = np.full_like(grid, fill)
+    height, width = grid.shape
+    if abs(dx) < width and abs(dy) < height:
+        shifted[max(-dy, 0):height - max(dy, 0), max(-dx, 0):width - max(dx, 0)] = grid[max(dy, 0):height - max(-dy, 0), max(dx, 0):width - max(-dx, 0)]
+    return shifted
+
+class Level:
+    def __init__(self, left, top, width, height):
+        self.left = left
+        self.top = top
+        self.width = width
+        self.height = height
+        self.tiles = np.full((height, width), TILE_EMPTY, dtype=np.uint8)
+        self.wall_variant = np.zeros((height, width), dtype=np.uint8)
+        self.floor_variant = np.full((height, width), NO_FLOOR, dtype=np.int8)
+        self.changes = set()
+        self.spawn = (0, 0)
+        self.pickups = []
+        self.enemies = []
+
+    @classmethod
+    def around(cls, xs, ys, margin=1):
+        left = int(np.min(xs)) - margin
+        top = int(np.min(ys)) - margin
+        return cls(left, top, int(np.max(xs)) - left + margin + 1, int(np.max(ys)) - top + margin + 1)
+
+    def in_bounds(self, x, y):
+        return 0 <= x - self.left < self.width and 0 <= y - self.top < self.height
+
+    def tile_at(self, x, y):
+        x, y = int(x), int(y)
+        if not self.in_bounds(x, y):
+            return TILE_EMPTY
+        return self.tiles[y - self.top, x - self.left]
+
+    def set_tile(self, x, y, tile):
+        self.tiles[int(y) - self.top, int(x) - self.left] = tile
+
+    def is_floor(self, x, y):
+        return self.tile_at(x, y) == TILE_FLOOR
+
+    def is_wall(self, x, y):
+        tile = self.tile_at(x, y)
+        return tile == TILE_WALL or tile == TILE_EXIT
+
+    def is_exit(self, x, y):
+        return self.tile_at(x, y) == TILE_EXIT
+
+    def set_floor_variant(self, x, y, variant):
+        self.floor_variant[int(y) - self.top, int(x) - self.left] = variant
+
+    def set_wall_variant(self, x, y, variant):
+        self.wall_variant[int(y) - self.top, int(x) - self.left] = variant
+
+    def change_wall_type(self, x, y, wall_type):
+        self.set_tile(x, y, TILE_EXIT if wall_type == 1 else TILE_WALL)
+        self.set_wall_variant(x, y, 0)
+        self.changes.add((int(x), int(y)))
+
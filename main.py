@@ -1,26 +1,56 @@
 from dungeon import DungeonGenerator
 from camera import Camera
+from spatial import SpatialIndex
+from render import TerrainRenderer, merge_rects
+from streams import RandomStreams
+from replay import Replay
+from profiler import Profiler
+from animation import AnimationClock
+from pathfinding import DistanceField
+from fov import FieldOfView
+from savegame import SaveGame
+from pool import SpritePool
+from world import World, StreamedLevel
+from quality import generate_best
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from settings import *
 from sprites import *
 import pygame
+import multiprocessing
+import copy
 import sys
 import os
 
 class Game:
-    def __init__(self):
-        os.environ['SDL_VIDEO_CENTERED'] = '1'
+    def __init__(self, headless=False):
+        self.headless = headless
+        if headless:
+            os.environ['SDL_VIDEODRIVER'] = 'dummy'
+            os.environ['SDL_AUDIODRIVER'] = 'dummy'
+            os.environ['SDL_NO_SIGNAL_HANDLERS'] = '1'
+        else:
+            os.environ['SDL_VIDEO_CENTERED'] = '1'
         pygame.init()
         pygame.key.set_repeat(KEYBOARD_REPEAT_THRESHOLD, KEYBOARD_REPEAT_INTERVAL)
         pygame.display.set_icon(pygame.image.load(WINDOW_ICON))
         pygame.display.set_caption(SCREEN_TITLE)
         pygame.mouse.set_visible(False)
         self.fullscreen = False
-        self.screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT), pygame.HWSURFACE | pygame.DOUBLEBUF)
+        self.set_mode()
         self.clock = pygame.time.Clock()
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.level_pool = None
+        if not headless and LEVEL_CANDIDATES > 1:
+            workers = min(LEVEL_WORKERS, LEVEL_CANDIDATES, os.cpu_count() or 1)
+            self.level_pool = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"))
+        self.pool = SpritePool(self)
         self.load_data()
 
     def load_data(self):
-        self.sprite_sheet = Spritesheet(SPRITE_SHEET, (IMAGE_SIZE, IMAGE_SIZE))
+        self.sprite_sheet = Spritesheet(SPRITE_SHEET, (IMAGE_SIZE, IMAGE_SIZE), SPRITE_CACHE, TILE_SIZE)
+        self.ui_sheet = self.sprite_sheet
+        if TILE_SIZE != SPRITE_SIZE:
+            self.ui_sheet = Spritesheet(SPRITE_SHEET, (IMAGE_SIZE, IMAGE_SIZE))
         self.font = pygame.font.Font(FONT_FILE, 24)
         self.sounds = {
             "COIN" : pygame.mixer.Sound(PLAYER_PICKUP_COIN_SOUND),
@@ -28,6 +58,7 @@ class Game:
             "HIT" : [pygame.mixer.Sound(sound) for sound in HIT_SOUND]
         }
         self.highscore = self.load_highscore()
+        self.profiler = Profiler(self)
 
     def load_highscore(self):
         if os.path.isfile(HIGHSCORE):
@@ -40,104 +71,392 @@ class Game:
         with open(HIGHSCORE, "w") as f:
             f.write(str(self.highscore))
 
-    def new(self):
+    def new(self, seed=None):
+        self.reset(seed)
+        self.new_level()
+
+    def reset(self, seed=None):
+        self.random = RandomStreams(seed)
+        self.seed = self.random.seed
+        self.replay = Replay(self.seed)
         self.stage = 0
+        self.playing = True
+        self.restart = False
         self.layers = {
-            "FLOOR" : pygame.sprite.Group(),
             "SHADOWS" : pygame.sprite.Group(),
-            "WALLS" : pygame.sprite.Group(),
             "PICKUPS" : pygame.sprite.Group(),
             "ENEMIES" : pygame.sprite.Group(),
             "PLAYER" : pygame.sprite.Group(),
             "UI" : pygame.sprite.Group()
         }
+        self.grid = {
+            "PICKUPS" : SpatialIndex(),
+            "ENEMIES" : SpatialIndex(),
+            "PLAYER" : SpatialIndex()
+        }
+        self.animation = AnimationClock()
+        self.distance_field = DistanceField()
+        self.fov = FieldOfView()
         self.player = Player(self, 0, 0, 0)
         self.camera = Camera()
         self.UI = UserInterface(self)
-        self.generator = DungeonGenerator(self)
-        self.new_level()
+        self.terrain = TerrainRenderer(self)
+        self.generator = DungeonGenerator(self.title_screen)
+        self.next_level = None
+        self.drawn = {}
+        self.drawn_camera = None
+        self.full_redraw = True
 
     def clear_layer(self, layer):
         for sprite in layer:
             sprite.delete()
 
     def new_level(self):
-        self.clear_layer(self.layers["FLOOR"])
-        self.clear_layer(self.layers["WALLS"])
+        if STREAMED_LEVELS:
+            level = self.streamed_level(self.stage)
+        elif self.next_level and self.next_level_stage == self.stage:
+            level = self.next_level.result()
+        else:
+            level = self.generate(self.generator, self.stage)
+        self.load_level(level)
+        self.stage += 1
+        self.pregenerate()
+
+    def streamed_level(self, stage):
+        return StreamedLevel(World(self.random.level_seed(stage), stage))
+
+    def pregenerate(self):
+        self.next_level = None
+        if PREGENERATE_LEVELS and not STREAMED_LEVELS:
+            generator = copy.copy(self.generator)
+            generator.progress = None
+            self.next_level_stage = self.stage
+            self.next_level = self.executor.submit(self.generate, generator, self.stage)
+
+    def generate(self, generator, stage):
+        return generate_best(generator, self.random.candidate_seeds(stage, LEVEL_CANDIDATES), stage, self.level_pool)
+
+    def load_level(self, level):
         self.clear_layer(self.layers["PICKUPS"])
         self.clear_layer(self.layers["ENEMIES"])
-        self.player.pos.x = 0
-        self.player.pos.y = 0
+        self.level = level
+        self.grid["PLAYER"].move(self.player, *level.spawn)
         self.player.key = False
-        self.generator.generate()
-        self.stage += 1
+        for x, y, pickup_type in level.pickups:
+            self.pool.acquire(Pickup, x, y, pickup_type)
+        for x, y, enemy_type in level.enemies:
+            self.pool.acquire(Enemy, x, y, enemy_type)
+        self.stream()
+
+    def stream(self):
+        if not isinstance(self.level, StreamedLevel):
+            return
+        entered, dropped = self.level.follow(self.player.pos.x, self.player.pos.y)
+        for chunk in dropped:
+            self.unload_chunk(*chunk)
+        for chunk in entered:
+            self.load_chunk(*chunk)
+
+    def load_chunk(self, cx, cy):
+        pickups, enemies = self.level.world.entities(cx, cy)
+        for x, y, pickup_type in pickups.tolist():
+            if not self.grid["PICKUPS"].get(x, y):
+                self.pool.acquire(Pickup, x, y, pickup_type)
+        for x, y, enemy_type, damage, health, hit_resistance, accuracy in enemies.tolist():
+            if not self.grid["ENEMIES"].get(x, y):
+                enemy = self.pool.acquire(Enemy, x, y, enemy_type)
+                enemy.damage, enemy.health, enemy.hit_resistance, enemy.accuracy = damage, health, hit_resistance, accuracy
+
+    def chunk_entities(self, cx, cy):
+        left, top = cx * CHUNK_SIZE, cy * CHUNK_SIZE
+        pickups = self.grid["PICKUPS"].query(left, top, left + CHUNK_SIZE, top + CHUNK_SIZE)
+        enemies = self.grid["ENEMIES"].query(left, top, left + CHUNK_SIZE, top + CHUNK_SIZE)
+        pickup_rows = [(int(pickup.pos.x), int(pickup.pos.y), pickup.type) for pickup in pickups]
+        enemy_rows = [(int(enemy.pos.x), int(enemy.pos.y), enemy.type, enemy.damage, enemy.health, enemy.hit_resistance, enemy.accuracy) for enemy in enemies]
+        return pickups + enemies, pickup_rows, enemy_rows
+
+    def unload_chunk(self, cx, cy):
+        sprites, pickup_rows, enemy_rows = self.chunk_entities(cx, cy)
+        self.level.world.keep_entities(cx, cy, pickup_rows, enemy_rows)
+        for sprite in sprites:
+            sprite.delete()
+
+    def score(self):
+        return self.stage * STAGE_POINTS + self.player.coins * COIN_POINTS + self.player.enemies_killed * ENEMY_KILL_POINTS
+
+    def state(self):
+        return {
+            "playing" : self.playing,
+            "stage" : self.stage,
+            "score" : self.score(),
+            "x" : int(self.player.pos.x),
+            "y" : int(self.player.pos.y),
+            "health" : self.player.health,
+            "max_health" : self.player.max_health,
+            "coins" : self.player.coins,
+            "key" : self.player.key,
+            "enemies_killed" : self.player.enemies_killed
+        }
+
+    def move(self, dx, dy):
+        if (dx, dy) not in DIRECTIONS:
+            raise ValueError("Move must be one of {}, not {}".format(DIRECTIONS, (dx, dy)))
+        if self.playing:
+            self.replay.record(dx, dy)
+            self.player.move(dx, dy)
+            self.stream()
+            self.enemy_turn()
+        return self.state()
+
+    def enemy_turn(self):
+        if all(behaviour == "idle" for behaviour in ENEMY_BEHAVIOURS) or not self.playing:
+            return
+        x, y = int(self.player.pos.x), int(self.player.pos.y)
+        radius = self.distance_field.radius
+        self.distance_field.update(self.level, x, y)
+        for enemy in self.grid["ENEMIES"].query(x - radius, y - radius, x + radius + 1, y + radius + 1):
+            if not self.playing:
+                break
+            enemy.act()
+
+    def save_game(self, filename=SAVE_FILE):
+        SaveGame.from_game(self).save(filename)
+
+    def load_game(self, filename=SAVE_FILE):
+        SaveGame.load(filename).restore(self)
+        return self.state()
 
     def game_over(self):
         self.playing = False
 
     def run(self):
         self.new()
-        self.playing = True
-        self.restart = False
+        self.dirty = True
         while self.playing:
-            self.dt = self.clock.tick(FRAMERATE) / 1000
-            self.events()
-            self.update()
-            self.draw()
+            self.dt = self.clock.tick() / 1000
+            events = self.wait_for_events()
+            self.profiler.begin_frame()
+            with self.profiler.section("events"):
+                self.events(events)
+            if self.animation.tick(pygame.time.get_ticks()):
+                self.dirty = True
+            if self.dirty:
+                with self.profiler.section("update"):
+                    self.update()
+                self.draw()
+            self.profiler.end_frame()
+
+    def wait_for_events(self):
+        timeout = self.animation.next_frame - pygame.time.get_ticks()
+        if timeout < 1:
+            return pygame.event.get()
+        return [pygame.event.wait(timeout)] + pygame.event.get()
 
     def toggle_fullscreen(self):
         self.fullscreen = not self.fullscreen
+        self.set_mode()
+
+    def set_mode(self):
+        flags = pygame.HWSURFACE | pygame.DOUBLEBUF
+        size = (SCREEN_WIDTH, SCREEN_HEIGHT)
+        if NATIVE_RENDER:
+            flags |= pygame.RESIZABLE
+            if self.fullscreen:
+                size = (0, 0)
         if self.fullscreen:
-            self.screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT), pygame.HWSURFACE | pygame.DOUBLEBUF | pygame.FULLSCREEN)
+            flags |= pygame.FULLSCREEN
+        pygame.display.set_mode(size, flags)
+        self.canvas = pygame.Surface((RENDER_WIDTH, RENDER_HEIGHT)).convert() if NATIVE_RENDER else None
+        self.resize()
+
+    def resize(self):
+        self.screen = pygame.display.get_surface()
+        self.view = self.screen.get_rect()
+        self.scale = 1
+        if NATIVE_RENDER:
+            self.view = self.canvas.get_rect().fit(self.view)
+            scale = self.view.width // RENDER_WIDTH
+            self.scale = scale if self.view.size == (RENDER_WIDTH * scale, RENDER_HEIGHT * scale) else None
         else:
-            self.screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT), pygame.HWSURFACE | pygame.DOUBLEBUF)
+            self.canvas = self.screen
+        self.full_redraw = True
 
     def quit(self):
+        if self.level_pool:
+            self.level_pool.shutdown(cancel_futures=True)
         pygame.quit()
         sys.exit()
 
     def update(self):
-        self.layers["SHADOWS"].update()
-        self.layers["PICKUPS"].update()
-        self.layers["PLAYER"].update()
-        self.layers["ENEMIES"].update()
-        self.layers["UI"].update()
+        with self.profiler.section("update.PLAYER"):
+            self.player.update()
         self.camera.update(self.player)
+        self.visible = self.visible_sprites()
+        for layer in ("PICKUPS", "ENEMIES", "SHADOWS"):
+            with self.profiler.section("update." + layer):
+                for sprite in self.visible[layer]:
+                    sprite.update()
+        with self.profiler.section("update.UI"):
+            self.layers["UI"].update()
 
-    def events(self):
-        for event in pygame.event.get():
+    def events(self, events):
+        for event in events:
             if event.type == pygame.QUIT:
                 self.quit()
+            if event.type == pygame.VIDEOEXPOSE:
+                self.dirty = True
+                self.full_redraw = True
+            if event.type == pygame.VIDEORESIZE:
+                self.dirty = True
+                self.resize()
             if event.type == pygame.KEYDOWN:
+                self.dirty = True
                 if event.key == pygame.K_ESCAPE:
                     self.quit()
                 if event.key == pygame.K_LEFT or event.key == pygame.K_a:
-                    self.player.move(dx=-1)
+                    self.move(-1, 0)
                 if event.key == pygame.K_RIGHT or event.key == pygame.K_d:
-                    self.player.move(dx=1)
+                    self.move(1, 0)
                 if event.key == pygame.K_UP or event.key == pygame.K_w:
-                    self.player.move(dy=-1)
+                    self.move(0, -1)
                 if event.key == pygame.K_DOWN or event.key == pygame.K_s:
-                    self.player.move(dy=1)
+                    self.move(0, 1)
                 if event.key == pygame.K_f:
                     self.toggle_fullscreen()
+                if event.key == pygame.K_F3:
+                    self.profiler.toggle_overlay()
+                    self.full_redraw = True
+                if event.key == pygame.K_F4:
+                    self.profiler.toggle_trace()
+                if event.key == pygame.K_F5:
+                    self.save_game()
+                if event.key == pygame.K_F9 and os.path.isfile(SAVE_FILE):
+                    self.load_game()
                 if event.key == pygame.K_r:
                     self.restart = True
                     self.game_over()
                     self.end_screen()
 
     def draw(self):
-        self.update()
-        self.events()
-        self.screen.fill(BACKGROUND_COLOUR)
+        with self.profiler.section("draw"):
+            layers = self.visible
+            bounds = self.canvas.get_rect()
+            rects = [rect.clip(bounds) for rect in merge_rects(self.dirty_rects(layers)) if rect.colliderect(bounds)]
+            if self.profiler.overlay or not self.scale:
+                self.full_redraw = True
+            if self.full_redraw or not DIRTY_RECTS:
+                self.draw_layers(layers)
+                #self.draw_grid()
+            else:
+                for rect in rects:
+                    self.canvas.set_clip(rect)
+                    self.draw_layers(layers, rect)
+                self.canvas.set_clip(None)
+                self.screen.set_clip(None)
+                rects = [self.window_rect(rect) for rect in rects]
+        if self.profiler.overlay:
+            self.profiler.draw(self.screen)
+        with self.profiler.section("flip"):
+            if self.full_redraw or not DIRTY_RECTS:
+                pygame.display.flip()
+            else:
+                pygame.display.update(rects)
+        self.full_redraw = False
+        self.dirty = False
+
+    def visible_sprites(self):
+        left, top, right, bottom = self.camera.viewport()
+        if FOG_OF_WAR:
+            self.fov.update(self.level, self.player.pos.x, self.player.pos.y)
+        layers = {}
         for layer in self.layers:
-            for sprite in self.layers[layer]:
-                if layer != "UI":
-                    self.screen.blit(sprite.image, self.camera.apply(sprite))
-                else:
-                    self.screen.blit(sprite.image, sprite.rect)
-        #self.draw_grid()
-        pygame.display.flip()
+            if layer == "SHADOWS":
+                layers[layer] = [entity.shadow for name, grid in self.grid.items() for entity in grid.query(left, top - 1, right, bottom) if self.in_sight(name, entity)]
+            elif layer in self.grid:
+                layers[layer] = [entity for entity in self.grid[layer].query(left, top, right, bottom) if self.in_sight(layer, entity)]
+            else:
+                layers[layer] = self.layers[layer].sprites()
+        return layers
+
+    def in_sight(self, layer, entity):
+        if not FOG_OF_WAR or layer == "PLAYER":
+            return True
+        if layer == "PICKUPS":
+            return self.fov.is_explored(entity.pos.x, entity.pos.y)
+        return self.fov.is_visible(entity.pos.x, entity.pos.y)
+
+    def screen_rect(self, layer, sprite):
+        if layer == "UI":
+            return sprite.rect.move(self.view.topleft)
+        return pygame.Rect(self.camera.apply(sprite), sprite.rect.size)
+
+    def window_rect(self, rect):
+        return pygame.Rect(self.view.x + rect.x * self.scale, self.view.y + rect.y * self.scale, rect.width * self.scale, rect.height * self.scale)
+
+    def canvas_rect(self, rect):
+        left = (rect.left - self.view.x) // self.scale
+        top = (rect.top - self.view.y) // self.scale
+        right = -((self.view.x - rect.right) // self.scale)
+        bottom = -((self.view.y - rect.bottom) // self.scale)
+        return pygame.Rect(left, top, right - left, bottom - top)
+
+    def dirty_rects(self, layers):
+        if self.camera.camera.topleft != self.drawn_camera:
+            self.drawn_camera = self.camera.camera.topleft
+            self.full_redraw = True
+        rects = []
+        drawn = {}
+        for layer, sprites in layers.items():
+            for sprite in sprites:
+                rect = self.screen_rect(layer, sprite)
+                if layer == "UI" and self.scale:
+                    rect = self.canvas_rect(rect)
+                previous = self.drawn.get(sprite)
+                if sprite.dirty or rect != previous:
+                    rects.append(rect)
+                    if previous:
+                        rects.append(previous)
+                    if sprite.dirty == 1:
+                        sprite.dirty = 0
+                drawn[sprite] = rect
+        for sprite, rect in self.drawn.items():
+            if sprite not in drawn:
+                rects.append(rect)
+        self.drawn = drawn
+        return rects
+
+    def draw_layers(self, layers, area=None):
+        surface = self.canvas
+        surface.fill(BACKGROUND_COLOUR, area)
+        self.profiler.blits += self.terrain.draw_floor(surface, self.camera, area)
+        for layer, sprites in layers.items():
+            if layer == "PICKUPS":
+                self.profiler.blits += self.terrain.draw_walls(surface, self.camera, area)
+            if layer == "UI":
+                if FOG_OF_WAR:
+                    self.profiler.blits += self.terrain.draw_fog(surface, self.camera, self.fov)
+                if NATIVE_RENDER:
+                    self.upscale(area)
+                    surface = self.screen
+                    if area is not None:
+                        area = self.window_rect(area)
+                        surface.set_clip(area)
+            for sprite in sprites:
+                rect = self.screen_rect(layer, sprite)
+                if area is None or rect.colliderect(area):
+                    surface.blit(sprite.image, rect)
+                    self.profiler.blits += 1
+
+    def upscale(self, area=None):
+        if area is not None:
+            window = self.window_rect(area)
+            pygame.transform.scale(self.canvas.subsurface(area), window.size, self.screen.subsurface(window))
+        elif self.view.size == self.screen.get_size():
+            pygame.transform.scale(self.canvas, self.view.size, self.screen)
+        else:
+            self.screen.fill(BACKGROUND_COLOUR)
+            self.screen.blit(pygame.transform.scale(self.canvas, self.view.size), self.view)
+        self.profiler.blits += 1
 
     def start_screen(self):
         self.title_screen("PRESS ANY KEY TO START")
@@ -146,14 +465,15 @@ class Game:
     def end_screen(self):
         pygame.event.pump()
         self.screen.fill(BACKGROUND_COLOUR)
+        self.replay.save(REPLAY_FILE)
         if self.restart:
             return
-        score = self.stage * STAGE_POINTS + self.player.coins * COIN_POINTS + self.player.enemies_killed * ENEMY_KILL_POINTS
+        score = self.score()
         if score > self.highscore:
             self.highscore = score
             self.save_highscore()
-        self.render_text("You scored {}".format(score), (SCREEN_WIDTH / 2, SCREEN_HEIGHT / 2 - 32))
-        self.render_text("Your best {}".format(self.highscore), (SCREEN_WIDTH / 2, SCREEN_HEIGHT / 2))
+        self.render_text("You scored {}".format(score), (self.view.centerx, self.view.centery - 32))
+        self.render_text("Your best {}".format(self.highscore), self.view.center)
         pygame.display.flip()
         pygame.time.wait(1000)
         self.wait_for_key()
@@ -161,8 +481,7 @@ class Game:
     def wait_for_key(self):
         waiting = True
         while waiting:
-            self.clock.tick(FRAMERATE)
-            for event in pygame.event.get():
+            for event in [pygame.event.wait()] + pygame.event.get():
                 if event.type == pygame.QUIT:
                     self.quit()
                 if event.type == pygame.KEYDOWN:
@@ -175,10 +494,13 @@ class Game:
                     waiting = False
 
     def title_screen(self, text, wait=0):
+        self.full_redraw = True
+        if self.headless:
+            return
         pygame.event.pump()
         self.screen.fill(BACKGROUND_COLOUR)
         text = self.font.render(text, False, WHITE, BLACK)
-        text_rect = text.get_rect(center=(SCREEN_WIDTH / 2, SCREEN_HEIGHT / 2))
+        text_rect = text.get_rect(center=self.view.center)
         self.screen.blit(text, text_rect)
         pygame.display.flip()
         pygame.time.wait(wait)
@@ -0,0 +1,70 @@
+from settings import *
+import numpy as np
+
+class DistanceField:
+    def __init__(self, radius=ENEMY_ACTIVATION_RADIUS):
+        self.radius = radius
+        self.size = radius * 2 + 1
+        self.distances = np.full((self.size, self.size), -1, dtype=np.int16)
+        self.level = None
+        self.target = None
+        self.left = 0
+        self.top = 0
+
+    def update(self, level, x, y):
+        x, y = int(x), int(y)
+        if level is self.level and (x, y) == self.target:
+            return
+        self.level = level
+        self.target = (x, y)
+        self.left = x - self.radius
+        self.top = y - self.radius
+        walkable = self.walkable(level)
+        distances = self.distances
+        distances.fill(-1)
+        distances[self.radius, self.radius] = 0
+        frontier = np.zeros((self.size, self.size), dtype=bool)
+        frontier[self.radius, self.radius] = True
+        seen = frontier.copy()
+        distance = 0
+        while True:
+            grown = np.zeros_like(frontier)
+            grown[1:] |= frontier[:-1]
+            grown[:-1] |= frontier[1:]
+            grown[:, 1:] |= frontier[:, :-1]
+            grown[:, :-1] |= frontier[:, 1:]
+            frontier = grown & walkable & ~seen
+            if not frontier.any():
+                break
+            distance += 1
+            seen |= frontier
+            distances[frontier] = distance
+
+    def walkable(self, level):
+        walkable = np.zeros((self.size, self.size), dtype=bool)
+        left = max(self.left, level.left)
+        top = max(self.top, level.top)
+        right = min(self.left + self.size, level.left + level.width)
+        bottom = min(self.top + self.size, level.top + level.height)
+        if left < right and top < bottom:
+            tiles = level.tiles[top - level.top:bottom - level.top, left - level.left:right - level.left]
+            walkable[top - self.top:bottom - self.top, left - self.left:right - self.left] = tiles == TILE_FLOOR
+        return walkable
+
+    def distance(self, x, y):
+        x, y = int(x) - self.left, int(y) - self.top
+        if 0 <= x < self.size and 0 <= y < self.size:
+            return int(self.distances[y, x])
+        return -1
+
+    def step(self, x, y, flee=False):
+        distance = self.distance(x, y)
+        if distance < 0:
+            return None
+        for dx, dy in DIRECTIONS:
+            next_distance = self.distance(x + dx, y + dy)
+            if next_distance < 0:
+                continue
+            if next_distance > distance if flee else next_distance < distance:
+                return dx, dy
+        return None
@@ -0,0 +1,23 @@
+from settings import *
+
+class SpritePool:
+    def __init__(self, game, size=POOL_SIZE):
+        self.game = game
+        self.size = size
+        self.free = {}
+
+    def __len__(self):
+        return sum(len(sprites) for sprites in self.free.values())
+
+    def acquire(self, sprite_class, *args):
+        free = self.free.get(sprite_class)
+        if free:
+            sprite = free.pop()
+            sprite.spawn(*args)
+            return sprite
+        return sprite_class(self.game, *args)
+
+    def release(self, sprite):
+        free = self.free.setdefault(type(sprite), [])
+        if len(free) < self.size:
+            free.append(sprite)
@@ -0,0 +1,91 @@
+from contextlib import contextmanager
+from collections import deque
+from settings import *
+import numpy as np
+import pygame
+import json
+import time
+
+class Profiler:
+    def __init__(self, game):
+        self.game = game
+        self.history = deque(maxlen=PROFILER_HISTORY)
+        self.overlay = False
+        self.trace = None
+        self.font = pygame.font.Font(FONT_FILE, PROFILER_FONT_SIZE)
+        self.frame_number = 0
+        self.begin_frame()
+
+    def begin_frame(self):
+        self.started = time.perf_counter()
+        self.sections = {}
+        self.blits = 0
+
+    @contextmanager
+    def section(self, name):
+        start = time.perf_counter()
+        yield
+        self.sections[name] = self.sections.get(name, 0) + time.perf_counter() - start
+
+    def end_frame(self):
+        if "draw" not in self.sections:
+            return
+        self.frame_number += 1
+        frame = {
+            "frame" : self.frame_number,
+            "total" : time.perf_counter() - self.started,
+            "blits" : self.blits,
+            "sections" : self.sections,
+            "sprites" : {layer : len(sprites) for layer, sprites in self.game.layers.items()}
+        }
+        self.history.append(frame)
+        if self.trace:
+            self.write_trace(frame)
+
+    def percentiles(self):
+        totals = [frame["total"] for frame in self.history]
+        if not totals:
+            return (0, 0, 0)
+        return tuple(np.percentile(totals, [50, 95, 99]) * 1000)
+
+    def toggle_overlay(self):
+        self.overlay = not self.overlay
+
+    def toggle_trace(self):
+        if self.trace:
+            self.trace.close()
+            self.trace = None
+            return
+        self.trace = open(PROFILER_TRACE_FILE, "w")
+        self.trace_columns = None
+
+    def write_trace(self, frame):
+        if not PROFILER_TRACE_FILE.endswith(".csv"):
+            self.trace.write(json.dumps(frame) + "\n")
+            return
+        row = {"frame" : frame["frame"], "total" : frame["total"], "blits" : frame["blits"]}
+        row.update(frame["sections"])
+        row.update({"sprites." + layer : count for layer, count in frame["sprites"].items()})
+        if self.trace_columns is None:
+            layers = list(frame["sprites"])
+            self.trace_columns = ["frame", "total", "blits", "events", "update"] + ["update." + layer for layer in layers] + ["draw", "flip"] + ["sprites." + layer for layer in layers]
+            self.trace.write(",".join(self.trace_columns) + "\n")
+        self.trace.write(",".join(str(row.get(column, 0)) for column in self.trace_columns) + "\n")
+
+    def draw(self, surface):
+        if not self.history:
+            return
+        last = self.history[-1]
+        lines = ["frame p50 {:.2f} p95 {:.2f} p99 {:.2f} ms".format(*self.percentiles())]
+        for name, elapsed in sorted(last["sections"].items()):
+            lines.append("{} {:.2f} ms".format(name, elapsed * 1000))
+        lines.append("blits {}".format(last["blits"]))
+        for layer, count in last["sprites"].items():
+            lines.append("{} {}".format(layer.lower(), count))
+        if self.trace:
+            lines.append("tracing to {}".format(PROFILER_TRACE_FILE))
+        y = SPRITE_SIZE * 2
+        for line in lines:
+            text = self.font.render(line, False, WHITE, BLACK)
+            surface.blit(text, (SPRITE_SIZE / 4, y))
+            y += text.get_height()
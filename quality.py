@@ -0,0 +1,69 @@
+from dungeon import shifted_neighbours
+from settings import *
+import numpy as np
+
+UNREACHED = np.iinfo(np.int32).max
+
+def flood(walkable, start):
+    distances = np.full(walkable.shape, -1, dtype=np.int32)
+    frontier = np.zeros_like(walkable)
+    frontier[start] = True
+    seen = frontier.copy()
+    distances[start] = 0
+    distance = 0
+    while True:
+        grown = np.zeros_like(frontier)
+        grown[1:] |= frontier[:-1]
+        grown[:-1] |= frontier[1:]
+        grown[:, 1:] |= frontier[:, :-1]
+        grown[:, :-1] |= frontier[:, 1:]
+        frontier = grown & walkable & ~seen
+        if not frontier.any():
+            break
+        distance += 1
+        seen |= frontier
+        distances[frontier] = distance
+    return distances
+
+def assess(level):
+    floor = level.tiles == TILE_FLOOR
+    distances = flood(floor, (level.spawn[1] - level.top, level.spawn[0] - level.left))
+    steps = np.stack(shifted_neighbours(distances + 1))
+    steps = np.where(steps > 0, steps, UNREACHED).min(axis=0)
+    exits = (level.tiles == TILE_EXIT) & (steps < UNREACHED)
+    keys = [(x, y) for x, y, pickup_type in level.pickups if pickup_type == 1]
+    key_reachable = any(distances[y - level.top, x - level.left] >= 0 for x, y in keys)
+
+    top, right, bottom, left = shifted_neighbours(floor)
+    neighbours = top.astype(np.uint8) + right + bottom + left
+    area = int(np.count_nonzero(floor))
+    metrics = {
+        "valid" : bool(exits.any()) and key_reachable,
+        "floor" : area,
+        "exit_distance" : int(steps[exits].min()) if exits.any() else 0,
+        "dead_ends" : int(np.count_nonzero(floor & (neighbours == 1))),
+        "enemy_density" : len(level.enemies) / max(area, 1)
+    }
+    metrics["score"] = (
+        metrics["floor"] * LEVEL_SCORE_FLOOR
+        + metrics["exit_distance"] * LEVEL_SCORE_EXIT_DISTANCE
+        - metrics["dead_ends"] * LEVEL_SCORE_DEAD_END
+        - abs(metrics["enemy_density"] - LEVEL_TARGET_ENEMY_DENSITY) * area * LEVEL_SCORE_ENEMY_DENSITY
+    )
+    return metrics
+
+def generate_candidate(generator, seed, stage):
+    level = generator.generate(seed, stage)
+    return assess(level), level
+
+def generate_best(generator, seeds, stage=0, executor=None):
+    if executor is None or len(seeds) == 1:
+        candidates = [generate_candidate(generator, seed, stage) for seed in seeds]
+    else:
+        generator.report("Generating {} levels".format(len(seeds)))
+        candidates = executor.map(generate_candidate, [generator] * len(seeds), seeds, [stage] * len(seeds))
+    best = None
+    for metrics, level in candidates:
+        if best is None or (metrics["valid"], metrics["score"]) > (best[0]["valid"], best[0]["score"]):
+            best = metrics, level
+    return best[1]
@@ -0,0 +1,128 @@
+from collections import OrderedDict
+from settings import *
+import numpy as np
+import pygame
+
+def merge_rects(rects):
+    merged = []
+    for rect in rects:
+        rect = rect.copy()
+        overlapping = rect.collidelistall(merged)
+        while overlapping:
+            rect.unionall_ip([merged[i] for i in overlapping])
+            merged = [other for i, other in enumerate(merged) if i not in overlapping]
+            overlapping = rect.collidelistall(merged)
+        merged.append(rect)
+    return merged
+
+class TerrainRenderer:
+    def __init__(self, game):
+        self.game = game
+        self.level = None
+        self.chunks = OrderedDict()
+        self.chunk_pixels = CHUNK_SIZE * TILE_SIZE
+        self.fog = None
+        self.fog_key = None
+        self.load_frames()
+
+    def load_frames(self):
+        self.floor_frames = self.game.sprite_sheet.get_frames(FLOOR_FRAMES)
+        self.wall_frames = self.game.sprite_sheet.get_frames(WALL_FRAMES[0])
+        self.exit_frame = self.game.sprite_sheet.get_image(WALL_FRAMES[1][0])
+
+    def sync(self):
+        level = self.game.level
+        if level is not self.level:
+            self.level = level
+            self.chunks.clear()
+            level.changes.clear()
+        for x, y in level.changes:
+            self.invalidate(x, y)
+        level.changes.clear()
+
+    def invalidate(self, x, y):
+        self.chunks.pop((x // CHUNK_SIZE, y // CHUNK_SIZE), None)
+
+    def visible_chunks(self, camera):
+        left, top, right, bottom = camera.viewport()
+        for cy in range(top // CHUNK_SIZE, (bottom - 1) // CHUNK_SIZE + 1):
+            for cx in range(left // CHUNK_SIZE, (right - 1) // CHUNK_SIZE + 1):
+                yield cx, cy
+
+    def get_chunk(self, cx, cy):
+        key = (cx, cy)
+        if key in self.chunks:
+            self.chunks.move_to_end(key)
+        else:
+            self.chunks[key] = self.build_chunk(cx, cy)
+            if len(self.chunks) > CHUNK_CACHE_SIZE:
+                self.chunks.popitem(last=False)
+        return self.chunks[key]
+
+    def build_chunk(self, cx, cy):
+        level = self.level
+        floor = pygame.Surface((self.chunk_pixels, self.chunk_pixels)).convert()
+        floor.fill(COLOUR_KEY)
+        floor.set_colorkey(COLOUR_KEY)
+        walls = floor.copy()
+        left = max(cx * CHUNK_SIZE, level.left) - level.left
+        top = max(cy * CHUNK_SIZE, level.top) - level.top
+        right = min((cx + 1) * CHUNK_SIZE, level.left + level.width) - level.left
+        bottom = min((cy + 1) * CHUNK_SIZE, level.top + level.height) - level.top
+        for y in range(top, bottom):
+            tiles = level.tiles[y, left:right].tolist()
+            wall_variants = level.wall_variant[y, left:right].tolist()
+            floor_variants = level.floor_variant[y, left:right].tolist()
+            for i in range(len(tiles)):
+                pos = ((left + level.left + i - cx * CHUNK_SIZE) * TILE_SIZE, (y + level.top - cy * CHUNK_SIZE) * TILE_SIZE)
+                if floor_variants[i] != NO_FLOOR:
+                    floor.blit(self.floor_frames[floor_variants[i]], pos)
+                if tiles[i] == TILE_WALL:
+                    walls.blit(self.wall_frames[wall_variants[i]], pos)
+                elif tiles[i] == TILE_EXIT:
+                    walls.blit(self.exit_frame, pos)
+        return floor, walls
+
+    def draw(self, surface, camera, layer, area=None):
+        self.sync()
+        blits = 0
+        for cx, cy in self.visible_chunks(camera):
+            rect = pygame.Rect(cx * self.chunk_pixels + camera.camera.x, cy * self.chunk_pixels + camera.camera.y, self.chunk_pixels, self.chunk_pixels)
+            if area is not None and not rect.colliderect(area):
+                continue
+            surface.blit(self.get_chunk(cx, cy)[layer], rect)
+            blits += 1
+        return blits
+
+    def draw_floor(self, surface, camera, area=None):
+        return self.draw(surface, camera, 0, area)
+
+    def draw_walls(self, surface, camera, area=None):
+        return self.draw(surface, camera, 1, area)
+
+    def draw_fog(self, surface, camera, fov):
+        left, top, right, bottom = camera.viewport()
+        key = (fov.level, fov.target, left, top)
+        if key != self.fog_key:
+            self.fog_key = key
+            self.fog = self.build_fog(fov, left, top, right, bottom)
+        surface.blit(self.fog, (left * TILE_SIZE + camera.camera.x, top * TILE_SIZE + camera.camera.y))
+        return 1
+
+    def build_fog(self, fov, left, top, right, bottom):
+        level = fov.level
+        shade = np.full((bottom - top, right - left), 255, dtype=np.uint8)
+        x0 = max(left, level.left)
+        y0 = max(top, level.top)
+        x1 = min(right, level.left + level.width)
+        y1 = min(bottom, level.top + level.height)
+        if x0 < x1 and y0 < y1:
+            explored = fov.explored[y0 - level.top:y1 - level.top, x0 - level.left:x1 - level.left]
+            shade[y0 - top:y1 - top, x0 - left:x1 - left][explored] = FOG_EXPLORED_ALPHA
+        for x, y in fov.visible:
+            if left <= x < right and top <= y < bottom:
+                shade[y - top, x - left] = 0
+        fog = pygame.Surface((right - left, bottom - top), pygame.SRCALPHA)
+        fog.fill(BACKGROUND_COLOUR)
+        pygame.surfarray.pixels_alpha(fog)[:] = shade.T
+        return pygame.transform.scale(fog, ((right - left) * TILE_SIZE, (bottom - top) * TILE_SIZE))
@@ -0,0 +1,103 @@
+from settings import *
+import argparse
+import struct
+import time
+import sys
+
+MAGIC = b"RLRP"
+VERSION = 1
+
+def write_varint(buffer, value):
+    while value > 0x7f:
+        buffer.append(value & 0x7f | 0x80)
+        value >>= 7
+    buffer.append(value)
+
+def read_varint(data, offset):
+    value = 0
+    shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7f) << shift
+        shift += 7
+        if not byte & 0x80:
+            return value, offset
+
+class Replay:
+    def __init__(self, seed, moves=None):
+        self.seed = seed
+        self.moves = moves if moves is not None else []
+
+    def record(self, dx, dy):
+        self.moves.append(DIRECTIONS.index((dx, dy)))
+
+    def encode(self):
+        buffer = bytearray(MAGIC)
+        buffer += struct.pack("<B", VERSION)
+        write_varint(buffer, self.seed)
+        write_varint(buffer, len(self.moves))
+        previous = 0
+        i = 0
+        while i < len(self.moves):
+            direction = self.moves[i]
+            run = 1
+            while i + run < len(self.moves) and self.moves[i + run] == direction:
+                run += 1
+            write_varint(buffer, (run - 1) << 2 | (direction - previous) % 4)
+            previous = direction
+            i += run
+        return bytes(buffer)
+
+    @classmethod
+    def decode(cls, data):
+        if data[:4] != MAGIC:
+            raise ValueError("Not a replay file")
+        version, = struct.unpack_from("<B", data, 4)
+        if version != VERSION:
+            raise ValueError("Unsupported replay version {}".format(version))
+        seed, offset = read_varint(data, 5)
+        count, offset = read_varint(data, offset)
+        moves = []
+        previous = 0
+        while len(moves) < count:
+            value, offset = read_varint(data, offset)
+            direction = (previous + (value & 3)) % 4
+            moves.extend([direction] * ((value >> 2) + 1))
+            previous = direction
+        return cls(seed, moves)
+
+    def save(self, filename):
+        with open(filename, "wb") as f:
+            f.write(self.encode())
+
+    @classmethod
+    def load(cls, filename):
+        with open(filename, "rb") as f:
+            return cls.decode(f.read())
+
+    def play(self, game):
+        game.new(self.seed)
+        state = game.state()
+        for direction in self.moves:
+            state = game.move(*DIRECTIONS[direction])
+        return state
+
+def main():
+    from main import Game
+    parser = argparse.ArgumentParser(description="Replay a recorded game headlessly.")
+    parser.add_argument("replay")
+    args = parser.parse_args()
+
+    replay = Replay.load(args.replay)
+    game = Game(headless=True)
+    start = time.perf_counter()
+    state = replay.play(game)
+    elapsed = time.perf_counter() - start
+    print("seed: {}".format(replay.seed))
+    print("turns: {} ({:.0f} turns/s)".format(len(replay.moves), len(replay.moves) / elapsed if elapsed else 0))
+    for key, value in state.items():
+        print("{}: {}".format(key, value))
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,155 @@
+from level import Level
+from replay import Replay
+from settings import *
+import numpy as np
+import struct
+import json
+import os
+
+MAGIC = b"RLSV"
+VERSION = 2
+HEADER = struct.Struct("<4sBI")
+ALIGNMENT = 8
+
+PICKUP_DTYPE = np.dtype([("x", "<i4"), ("y", "<i4"), ("type", "u1")])
+ENEMY_DTYPE = np.dtype([("x", "<i4"), ("y", "<i4"), ("type", "u1"), ("damage", "<f8"), ("health", "<f8"), ("hit_resistance", "<f8"), ("accuracy", "<f8")])
+STORE_DTYPE = np.dtype([("cx", "<i4"), ("cy", "<i4"), ("pickups", "<u4"), ("enemies", "<u4")])
+PLAYER_FIELDS = ["health", "max_health", "damage", "hit_resistance", "accuracy", "lifesteal", "coins", "key", "enemies_killed"]
+
+def aligned(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+class SaveGame:
+    def __init__(self, meta, level, explored, pickups, enemies, moves, store=None):
+        self.meta = meta
+        self.level = level
+        self.explored = explored
+        self.pickups = pickups
+        self.enemies = enemies
+        self.moves = moves
+        self.store = store if store is not None else {}
+
+    @classmethod
+    def from_game(cls, game):
+        level = game.level
+        player = game.player
+        meta = {
+            "seed" : game.seed,
+            "stage" : game.stage,
+            "combat" : game.random.combat.bit_generator.state,
+            "level" : [level.left, level.top, level.width, level.height],
+            "spawn" : list(level.spawn),
+            "player" : {field : getattr(player, field) for field in PLAYER_FIELDS},
+            "position" : [int(player.pos.x), int(player.pos.y)]
+        }
+        if game.fov.level is level:
+            explored = game.fov.explored
+        else:
+            explored = np.zeros((level.height, level.width), dtype=bool)
+        pickups = np.array([(int(pickup.pos.x), int(pickup.pos.y), pickup.type) for pickup in game.grid["PICKUPS"]], dtype=PICKUP_DTYPE)
+        enemies = np.array([(int(enemy.pos.x), int(enemy.pos.y), enemy.type, enemy.damage, enemy.health, enemy.hit_resistance, enemy.accuracy) for enemy in game.grid["ENEMIES"]], dtype=ENEMY_DTYPE)
+        moves = np.array(game.replay.moves, dtype=np.uint8)
+        store = {}
+        if hasattr(level, "world"):
+            meta["world"] = level.world.stage
+            store = dict(level.world.store)
+            for cx, cy in level.resident:
+                _, pickup_rows, enemy_rows = game.chunk_entities(cx, cy)
+                store[(cx, cy)] = (np.array(pickup_rows, dtype=PICKUP_DTYPE).tobytes(), np.array(enemy_rows, dtype=ENEMY_DTYPE).tobytes())
+        return cls(meta, level, explored, pickups, enemies, moves, store)
+
+    def store_arrays(self):
+        chunks = sorted(self.store)
+        index = np.array([(cx, cy, len(self.store[(cx, cy)][0]) // PICKUP_DTYPE.itemsize, len(self.store[(cx, cy)][1]) // ENEMY_DTYPE.itemsize) for cx, cy in chunks], dtype=STORE_DTYPE)
+        pickups = np.frombuffer(b"".join(self.store[chunk][0] for chunk in chunks), dtype=PICKUP_DTYPE)
+        enemies = np.frombuffer(b"".join(self.store[chunk][1] for chunk in chunks), dtype=ENEMY_DTYPE)
+        return [index, pickups, enemies]
+
+    def arrays(self):
+        return [self.level.tiles, self.level.wall_variant, self.level.floor_variant, self.explored, self.pickups, self.enemies, self.moves] + self.store_arrays()
+
+    def save(self, filename):
+        self.meta["pickups"] = len(self.pickups)
+        self.meta["enemies"] = len(self.enemies)
+        self.meta["moves"] = len(self.moves)
+        self.meta["store"] = [len(array) for array in self.store_arrays()]
+        meta = json.dumps(self.meta).encode()
+        partial = filename + ".tmp"
+        with open(partial, "wb") as f:
+            f.write(HEADER.pack(MAGIC, VERSION, len(meta)))
+            f.write(meta)
+            for array in self.arrays():
+                f.write(bytes(aligned(f.tell()) - f.tell()))
+                f.write(np.ascontiguousarray(array).tobytes())
+        os.replace(partial, filename)
+
+    @classmethod
+    def load(cls, filename):
+        with open(filename, "rb") as f:
+            magic, version, meta_length = HEADER.unpack(f.read(HEADER.size))
+            if magic != MAGIC:
+                raise ValueError("Not a save file")
+            if version != VERSION:
+                raise ValueError("Unsupported save version {}".format(version))
+            meta = json.loads(f.read(meta_length))
+        offset = HEADER.size + meta_length
+        def read(dtype, shape):
+            nonlocal offset
+            offset = aligned(offset)
+            dtype = np.dtype(dtype)
+            if not np.prod(shape):
+                return np.zeros(shape, dtype=dtype)
+            array = np.memmap(filename, dtype=dtype, mode="c", offset=offset, shape=shape)
+            offset += array.nbytes
+            return array
+        left, top, width, height = meta["level"]
+        level = Level(left, top, width, height)
+        level.tiles = read(np.uint8, (height, width))
+        level.wall_variant = read(np.uint8, (height, width))
+        level.floor_variant = read(np.int8, (height, width))
+        level.spawn = tuple(meta["spawn"])
+        explored = read(bool, (height, width))
+        pickups = read(PICKUP_DTYPE, (meta["pickups"],))
+        enemies = read(ENEMY_DTYPE, (meta["enemies"],))
+        moves = read(np.uint8, (meta["moves"],))
+        chunks, pickup_count, enemy_count = meta["store"]
+        index = read(STORE_DTYPE, (chunks,))
+        stored_pickups = read(PICKUP_DTYPE, (pickup_count,))
+        stored_enemies = read(ENEMY_DTYPE, (enemy_count,))
+        store = {}
+        pickup_start = enemy_start = 0
+        for cx, cy, pickup_length, enemy_length in index.tolist():
+            store[(cx, cy)] = (stored_pickups[pickup_start:pickup_start + pickup_length].tobytes(), stored_enemies[enemy_start:enemy_start + enemy_length].tobytes())
+            pickup_start += pickup_length
+            enemy_start += enemy_length
+        return cls(meta, level, explored, pickups, enemies, moves, store)
+
+    def restore(self, game):
+        meta = self.meta
+        game.reset(meta["seed"])
+        game.random.combat.bit_generator.state = meta["combat"]
+        game.replay = Replay(game.seed, self.moves.tolist())
+        game.stage = meta["stage"]
+        if "world" in meta:
+            level = game.streamed_level(meta["world"])
+            level.world.store = self.store
+            game.load_level(level)
+        else:
+            level = self.level
+            level.pickups = [(int(x), int(y), int(pickup_type)) for x, y, pickup_type in self.pickups.tolist()]
+            level.enemies = [(int(x), int(y), int(enemy_type)) for x, y, enemy_type, *_ in self.enemies.tolist()]
+            game.load_level(level)
+            for x, y, enemy_type, damage, health, hit_resistance, accuracy in self.enemies.tolist():
+                enemy = game.grid["ENEMIES"].get(x, y)
+                enemy.damage = damage
+                enemy.health = health
+                enemy.hit_resistance = hit_resistance
+                enemy.accuracy = accuracy
+        for field, value in meta["player"].items():
+            setattr(game.player, field, value)
+        game.grid["PLAYER"].move(game.player, *meta["position"])
+        game.stream()
+        game.fov.level = level
+        game.fov.origin = (level.left, level.top)
+        game.fov.explored = self.explored
+        game.pregenerate()
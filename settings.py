@@ -14,25 +14,42 @@ MAGENTA = (255, 0, 255)
 SCREEN_TITLE = "Roguelike"
 SCREEN_WIDTH = 640
 SCREEN_HEIGHT = 480
-FRAMERATE = 30
 BACKGROUND_COLOUR = BLACK
+DIRTY_RECTS = True
+FOG_OF_WAR = True
+FOV_RADIUS = 8 # tiles
+FOV_CACHE_SIZE = 256 # positions
+FOG_EXPLORED_ALPHA = 160
+
+# Profiler
+PROFILER_HISTORY = 300 # frames
+PROFILER_FONT_SIZE = 10
+PROFILER_TRACE_FILE = "frame_trace.jsonl"
 
 # Grid
 IMAGE_SIZE = 4
 SPRITE_SIZE = 32
+NATIVE_RENDER = True
+TILE_SIZE = IMAGE_SIZE if NATIVE_RENDER else SPRITE_SIZE # pixels per tile on the render target
+RENDER_WIDTH = SCREEN_WIDTH * TILE_SIZE // SPRITE_SIZE
+RENDER_HEIGHT = SCREEN_HEIGHT * TILE_SIZE // SPRITE_SIZE
 COLOUR_KEY = MAGENTA
 GRID_WIDTH = SCREEN_WIDTH / SPRITE_SIZE
 GRID_HEIGHT = SCREEN_HEIGHT / SPRITE_SIZE
 
 # Input
+DIRECTIONS = [(0, -1), (1, 0), (0, 1), (-1, 0)]
 KEYBOARD_REPEAT_THRESHOLD = 1  # ms
 KEYBOARD_REPEAT_INTERVAL = 150 # ms
 
 # Resources
 RESOURCES_FOLDER = os.path.join(".", "resources")
 HIGHSCORE = os.path.join(RESOURCES_FOLDER, "highscore.txt")
+REPLAY_FILE = os.path.join(RESOURCES_FOLDER, "last_game.replay")
+SAVE_FILE = os.path.join(RESOURCES_FOLDER, "quicksave.sav")
 WINDOW_ICON = os.path.join(RESOURCES_FOLDER, "icon.png")
 SPRITE_SHEET = os.path.join(RESOURCES_FOLDER, "sprites.png")
+SPRITE_CACHE = os.path.join(RESOURCES_FOLDER, "sprites_cache.png") # None to crop lazily without a cache file
 FONT_FILE = os.path.join(RESOURCES_FOLDER, "font.ttf")
 
 HIT_SOUND = [os.path.join(RESOURCES_FOLDER, "hit_{}.wav".format(x)) for x in range(4)]
@@ -72,6 +89,7 @@ UI_HEALTH = [
     (0, 6), (1, 6), (2, 6), (3, 6)
 ]
 UI_KEY = (5, 3)
+UI_STATS = ("health", "max_health", "coins", "key")
 UI_COIN = (4, 6)
 
 # Entity stats
@@ -83,13 +101,67 @@ ENEMY_STATS = [
     [1.5, 8, 0.35, 0.35]
 ]
 
+ENEMY_STAGE_SCALING = 0.001 # added to every enemy stat per stage
+
+# [heal, lifesteal, accuracy, damage, hit_resistance] granted to the player per kill
+KILL_BONUS = [
+    [3, 0.005,     0,     0,     0],
+    [0,     0, 0.005,     0,     0],
+    [0,     0,     0, 0.001,     0],
+    [0,     0,     0,     0, 0.005]
+]
+
+# idle, chase or flee
+ENEMY_BEHAVIOURS = ["idle", "idle", "idle", "idle"]
+ENEMY_ACTIVATION_RADIUS = 8 # tiles
+
 PLAYER_STATS = [
     1, 15, 0.25, 0.5
 ]
+AUTOPLAY_HEALTH_MARGIN = 2 # health the autoplayer keeps in reserve when picking fights
 
 BASE_HIT_CHANCE = 0.1
+MIN_HIT_CHANCE = 0.1
 
 # Points
 STAGE_POINTS = 10
 COIN_POINTS = 25
 ENEMY_KILL_POINTS = 50
+
+# Tiles
+CHUNK_SIZE = 16 # tiles
+CHUNK_CACHE_SIZE = 12 # chunks
+TILE_EMPTY = 0
+TILE_FLOOR = 1
+TILE_WALL = 2
+TILE_EXIT = 3
+NO_FLOOR = -1
+
+# Pooling
+POOL_SIZE = 256 # released sprites kept per type
+
+# Streaming
+STREAMED_LEVELS = False
+STREAM_RADIUS = 2 # chunks kept around the player's chunk
+STREAM_CHUNK_CACHE = 96 # chunks
+STREAM_CAVE_STEPS = 48
+STREAM_CORRIDOR_BIAS = 0.6
+STREAM_EXIT_CHANCE = 0.05
+STREAM_KEY_CHANCE = 0.05
+
+# Generation
+GENERATOR_VECTORIZED = True
+COIN_SPAWN_CHANCE = 0.75
+COIN_MIN_DISTANCE = 0 # tiles
+ENEMY_SPAWN_CHANCE = 0.1
+ENEMY_SPAWN_CHANCE_PER_STAGE = 0
+ENEMY_SPAWN_CHANCE_MAX = 0.5
+ENEMY_MIN_DISTANCE = 5 # tiles
+PREGENERATE_LEVELS = True
+LEVEL_CANDIDATES = 4
+LEVEL_WORKERS = LEVEL_CANDIDATES # processes, capped at the CPU count
+LEVEL_TARGET_ENEMY_DENSITY = 0.02 # enemies per floor tile
+LEVEL_SCORE_FLOOR = 1
+LEVEL_SCORE_EXIT_DISTANCE = 2
+LEVEL_SCORE_DEAD_END = 4
+LEVEL_SCORE_ENEMY_DENSITY = 10 # per enemy away from the target
@@ -0,0 +1,161 @@
+from autoplay import AutoPlayer
+from main import Game
+import numpy as np
+import tracemalloc
+import argparse
+import json
+import time
+import sys
+import os
+
+IGNORED = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, __file__),
+    tracemalloc.Filter(False, "*replay.py")
+]
+
+def rss():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+
+def sprite_counts(game):
+    counts = {layer.lower() : len(group) for layer, group in game.layers.items()}
+    counts.update({"grid." + name.lower() : len(grid) for name, grid in game.grid.items()})
+    counts["pool"] = len(game.pool)
+    counts["drawn"] = len(game.drawn)
+    return counts
+
+def heap(snapshot):
+    return sum(stat.size for stat in snapshot.statistics("filename"))
+
+def top_allocations(snapshot, baseline, limit):
+    stats = snapshot.compare_to(baseline, "lineno")
+    return ["{} {:+d} B {:+d} blocks".format(stat.traceback, stat.size_diff, stat.count_diff) for stat in stats[:limit]]
+
+def soak(stages, seed, draw, max_turns, snapshot_every, warmup, limit):
+    game = Game(headless=True)
+    rows = []
+    allocations = []
+    baseline = None
+    seed -= 1
+    while len(rows) < stages:
+        seed += 1
+        game.new(seed)
+        bot = AutoPlayer(game, seed)
+        while game.playing and len(rows) < stages:
+            stage = game.stage
+            turns = 0
+            timed = 0
+            elapsed = 0
+            while game.playing and game.stage == stage and turns < max_turns:
+                start = time.perf_counter()
+                game.move(*bot.choose())
+                if draw:
+                    game.update()
+                    game.draw()
+                turns += 1
+                if game.stage == stage:
+                    elapsed += time.perf_counter() - start
+                    timed += 1
+            rows.append({
+                "stage" : len(rows),
+                "seed" : seed,
+                "level" : stage,
+                "died" : not game.playing,
+                "stuck" : turns == max_turns,
+                "turns" : turns,
+                "timed_turns" : timed,
+                "seconds" : elapsed,
+                "turns_per_second" : timed / elapsed if elapsed else 0,
+                "rss" : rss(),
+                "traced" : tracemalloc.get_traced_memory()[0],
+                "sprites" : sprite_counts(game)
+            })
+            if len(rows) >= warmup and (len(rows) - warmup) % snapshot_every == 0:
+                snapshot = tracemalloc.take_snapshot().filter_traces(IGNORED)
+                rows[-1]["heap"] = heap(snapshot)
+                if baseline is None:
+                    baseline = snapshot
+                else:
+                    top = top_allocations(snapshot, baseline, limit)
+                    allocations.append({"stage" : len(rows), "top" : top})
+                    rows[-1]["top"] = top
+            if turns == max_turns:
+                break
+    return rows, allocations
+
+def median(rows, key):
+    return float(np.median([key(row) for row in rows]))
+
+def quarters(rows, key):
+    quarter = max(len(rows) // 4, 1)
+    return median(rows[:quarter], key), median(rows[-quarter:], key)
+
+def turn_rate(rows):
+    seconds = sum(row["seconds"] for row in rows)
+    return sum(row["timed_turns"] for row in rows) / seconds if seconds else 0
+
+def growth(rows, warmup, tolerance, slack_bytes, slack_sprites, speed_tolerance):
+    rows = rows[warmup:]
+    if len(rows) < 4:
+        return []
+    snapshots = [row for row in rows if "heap" in row]
+    failures = []
+    metrics = [("rss", rows, lambda row: row["rss"], slack_bytes), ("heap", snapshots, lambda row: row["heap"], slack_bytes)]
+    metrics += [(name, rows, lambda row, name=name: row["sprites"][name], slack_sprites) for name in rows[0]["sprites"]]
+    for name, series, key, slack in metrics:
+        if len(series) < 2:
+            continue
+        before, after = quarters(series, key)
+        if after > before * (1 + tolerance) + slack:
+            failures.append("{} grew from {:.0f} to {:.0f}".format(name, before, after))
+    quarter = max(len(rows) // 4, 1)
+    before, after = turn_rate(rows[:quarter]), turn_rate(rows[-quarter:])
+    if after < before * (1 - speed_tolerance):
+        failures.append("turns per second fell from {:.0f} to {:.0f}".format(before, after))
+    return failures
+
+def main():
+    parser = argparse.ArgumentParser(description="Autoplay many stages headlessly and fail if memory, sprites or speed drift.")
+    parser.add_argument("--stages", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-draw", dest="draw", action="store_false", help="skip update and draw after each turn")
+    parser.add_argument("--max-turns", type=int, default=5000, help="turns before a stage counts as stuck and a new game starts")
+    parser.add_argument("--warmup", type=int, default=100, help="stages ignored before measuring growth")
+    parser.add_argument("--snapshot-every", type=int, default=100, help="stages between tracemalloc snapshots")
+    parser.add_argument("--top", type=int, default=10, help="allocation sites listed per snapshot")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="relative growth allowed between the first and last quarter")
+    parser.add_argument("--slack-bytes", type=int, default=4 * 2 ** 20)
+    parser.add_argument("--slack-sprites", type=int, default=16)
+    parser.add_argument("--speed-tolerance", type=float, default=0.25)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    rows, allocations = soak(args.stages, args.seed, args.draw, args.max_turns, args.snapshot_every, args.warmup, args.top)
+    if args.output:
+        with open(args.output, "w") as f:
+            for row in rows:
+                f.write(json.dumps(row) + "\n")
+
+    print("stages: {} in {:.1f}s over {} games".format(len(rows), time.perf_counter() - started, len({row["seed"] for row in rows})))
+    print("deaths: {}, stuck: {}".format(sum(row["died"] for row in rows), sum(row["stuck"] for row in rows)))
+    print("turns per second: {:.0f}".format(turn_rate(rows)))
+    print("rss: {:.1f} MiB, traced: {:.1f} MiB".format(rows[-1]["rss"] / 2 ** 20, rows[-1]["traced"] / 2 ** 20))
+    print("sprites: {}".format(rows[-1]["sprites"]))
+    if allocations:
+        print("top allocations since stage {}:".format(args.warmup))
+        for line in allocations[-1]["top"]:
+            print("  " + line)
+    failures = growth(rows, args.warmup, args.tolerance, args.slack_bytes, args.slack_sprites, args.speed_tolerance)
+    for failure in failures:
+        print("GROWTH: " + failure)
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
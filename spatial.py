@@ -0,0 +1,78 @@
+import numpy as np
+
+class SpatialIndex:
+    def __init__(self):
+        self.cells = {}
+
+    def __len__(self):
+        return len(self.cells)
+
+    def __iter__(self):
+        return iter(list(self.cells.values()))
+
+    def add(self, sprite):
+        self.cells[(int(sprite.pos.x), int(sprite.pos.y))] = sprite
+
+    def remove(self, sprite):
+        key = (int(sprite.pos.x), int(sprite.pos.y))
+        if self.cells.get(key) is sprite:
+            del self.cells[key]
+
+    def move(self, sprite, x, y):
+        self.remove(sprite)
+        sprite.pos.x = x
+        sprite.pos.y = y
+        self.add(sprite)
+
+    def get(self, x, y):
+        return self.cells.get((int(x), int(y)))
+
+    def query(self, left, top, right, bottom):
+        if (right - left) * (bottom - top) < len(self.cells):
+            cells = self.cells
+            found = []
+            for y in range(top, bottom):
+                for x in range(left, right):
+                    sprite = cells.get((x, y))
+                    if sprite:
+                        found.append(sprite)
+            return found
+        return [sprite for (x, y), sprite in self.cells.items() if left <= x < right and top <= y < bottom]
+
+    def clear(self):
+        self.cells.clear()
+
+class PointGrid:
+    def __init__(self, spacing):
+        self.spacing = spacing
+        self.size = max(spacing, 1)
+        self.buckets = {}
+
+    def bucket(self, x, y):
+        return (int(x // self.size), int(y // self.size))
+
+    def fits(self, x, y):
+        if self.spacing <= 0:
+            return True
+        bx, by = self.bucket(x, y)
+        limit = self.spacing * self.spacing
+        for dy in range(-1, 2):
+            for dx in range(-1, 2):
+                for px, py in self.buckets.get((bx + dx, by + dy), ()):
+                    if (px - x) * (px - x) + (py - y) * (py - y) < limit:
+                        return False
+        return True
+
+    def add(self, x, y):
+        self.buckets.setdefault(self.bucket(x, y), []).append((x, y))
+
+def scatter(rng, cells, chance, min_distance):
+    picked = np.flatnonzero(rng.random(len(cells)) < chance)
+    grid = PointGrid(min_distance)
+    placed = []
+    for i in rng.permutation(picked).tolist():
+        x, y = cells[i]
+        if grid.fits(x, y):
+            grid.add(x, y)
+            placed.append(i)
+    return [cells[i] for i in sorted(placed)]
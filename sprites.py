@@ -1,12 +1,15 @@
+from combat import hit_chance, enemy_stats
 from settings import *
-import random
 import math
 import pygame
+import os
 
 Vector = pygame.math.Vector2
 
 class Spritesheet:
-    def __init__(self, filename, tile_size):
+    def __init__(self, filename, tile_size, cache_file=None, sprite_size=SPRITE_SIZE):
+        self.filename = filename
+        self.sprite_size = sprite_size
         self.texture = pygame.image.load(filename).convert()
         self.tile_width = tile_size[0]
         self.tile_height = tile_size[1]
@@ -16,10 +19,26 @@ class Spritesheet:
         self.sheet_width = int(self.texture_width / self.tile_width)
         self.sheet_height = int(self.texture_height / self.tile_height)
         self.count = self.sheet_width * self.sheet_height
-        self.sprites = [None for _ in range(self.count)]
-        for y in range(0, self.sheet_width):
-            for x in range(0, self.sheet_height):
-                self.sprites[y * self.sheet_width + x] = self.crop_image((x * self.tile_width, y * self.tile_height), (SPRITE_SIZE, SPRITE_SIZE))
+        self.sprites = {}
+        self.frames = {}
+        self.atlas = None
+        if cache_file and sprite_size != self.tile_width:
+            self.atlas = self.load_atlas(cache_file)
+
+    def load_atlas(self, cache_file):
+        size = (self.sheet_width * self.sprite_size, self.sheet_height * self.sprite_size)
+        if os.path.isfile(cache_file) and os.path.getmtime(cache_file) >= os.path.getmtime(self.filename):
+            atlas = pygame.image.load(cache_file).convert()
+            if atlas.get_size() == size:
+                return atlas
+        atlas = pygame.Surface(size)
+        for y in range(0, self.sheet_height):
+            for x in range(0, self.sheet_width):
+                image = self.crop_image((x * self.tile_width, y * self.tile_height), (self.sprite_size, self.sprite_size))
+                image.set_colorkey(None)
+                atlas.blit(image, (x * self.sprite_size, y * self.sprite_size))
+        pygame.image.save(atlas, cache_file)
+        return atlas
 
     def crop_image(self, pos, scale=False):
         image = pygame.Surface((self.tile_width, self.tile_height))
@@ -29,19 +48,43 @@ class Spritesheet:
             return pygame.transform.scale(image, (scale[0], scale[1]))
         return image
 
-    def get_image(self, pos):
-        return self.sprites[pos[1] * self.sheet_width + pos[0]]
+    def get_image(self, pos, flip=False):
+        key = (pos[0], pos[1], flip)
+        image = self.sprites.get(key)
+        if image is None:
+            if flip:
+                image = pygame.transform.flip(self.get_image(pos), True, False)
+            elif self.atlas:
+                size = self.sprite_size
+                image = self.atlas.subsurface((pos[0] * size, pos[1] * size, size, size)).copy()
+                image.set_colorkey(COLOUR_KEY)
+            elif self.sprite_size == self.tile_width:
+                image = self.crop_image((pos[0] * self.tile_width, pos[1] * self.tile_height))
+            else:
+                image = self.crop_image((pos[0] * self.tile_width, pos[1] * self.tile_height), (self.sprite_size, self.sprite_size))
+            self.sprites[key] = image
+        return image
 
-class Player(pygame.sprite.Sprite):
+    def get_frames(self, positions, flip=False):
+        key = (tuple(tuple(pos) for pos in positions), flip)
+        frames = self.frames.get(key)
+        if frames is None:
+            frames = [self.get_image(pos, flip) for pos in positions]
+            self.frames[key] = frames
+        return frames
+
+class Player(pygame.sprite.DirtySprite):
     def __init__(self, game, x, y, character_type):
+        self.watchers = []
         self.groups = game.layers["PLAYER"]
-        pygame.sprite.Sprite.__init__(self, self.groups)
+        pygame.sprite.DirtySprite.__init__(self, self.groups)
         self.game = game
         self.load_frames(character_type)
-        self.image = self.animation_R[0]
+        self.image = self.game.animation.image(self.frames)
         self.rect = self.image.get_rect()
         self.pos = Vector(x, y)
-        self.shadow = Shadow(self.game, self)
+        self.game.grid["PLAYER"].add(self)
+        self.shadow = self.game.pool.acquire(Shadow, self)
         self.enemies_killed = 0
         self.coins = 0
         self.lifesteal = 0
@@ -52,44 +95,49 @@ class Player(pygame.sprite.Sprite):
         self.accuracy = PLAYER_STATS[3]
         self.key = False
 
+    def __setattr__(self, name, value):
+        changed = name in UI_STATS and getattr(self, name, None) != value
+        pygame.sprite.DirtySprite.__setattr__(self, name, value)
+        if changed:
+            for watcher in self.watchers:
+                watcher(name)
+
     def load_frames(self, player_type):
-        self.animation_frame = 0
-        self.last_frame_time = 0
-        self.animation_R = [self.game.sprite_sheet.get_image(sprites) for sprites in PLAYER_ANIMATION_FRAMES[player_type]]
-        self.animation_L = [pygame.transform.flip(image, True, False) for image in self.animation_R]
-        self.frame_count = len(self.animation_R)
+        self.animation_frame = self.game.animation.frame
+        self.animation_R = self.game.sprite_sheet.get_frames(PLAYER_ANIMATION_FRAMES[player_type])
+        self.animation_L = self.game.sprite_sheet.get_frames(PLAYER_ANIMATION_FRAMES[player_type], True)
         self.frames = self.animation_R
 
     def update(self):
         self.animate()
-        self.rect.x = self.pos.x * SPRITE_SIZE
-        self.rect.y = self.pos.y * SPRITE_SIZE
+        self.rect.x = self.pos.x * TILE_SIZE
+        self.rect.y = self.pos.y * TILE_SIZE
         self.shadow.update()
 
     def animate(self):
-        now = pygame.time.get_ticks()
-        if now - self.last_frame_time > ANIMATION_INTERVAL:
-            self.last_frame_time = now
-            self.animation_frame = (self.animation_frame + 1) % self.frame_count
-            self.image = self.frames[self.animation_frame]
+        if self.animation_frame != self.game.animation.frame:
+            self.animation_frame = self.game.animation.frame
+            self.image = self.game.animation.image(self.frames)
+            self.dirty = 1
 
     def move(self, dx=0, dy=0):
-        wall = self.collide(self.game.layers["WALLS"], dx, dy)
+        wall = self.game.level.is_wall(self.pos.x + dx, self.pos.y + dy)
+        exit = self.game.level.is_exit(self.pos.x + dx, self.pos.y + dy)
         self.handle_encounters(dx, dy)
-        if wall and self.key:
-            wall.interact()
-        if not wall and not self.collide(self.game.layers["ENEMIES"], dx, dy):
-            self.pos.x += dx
-            self.pos.y += dy
+        if exit and self.key:
+            self.game.new_level()
+        if not wall and not self.collide(self.game.grid["ENEMIES"], dx, dy):
+            self.game.grid["PLAYER"].move(self, self.pos.x + dx, self.pos.y + dy)
         self.handle_pickups()
         if dx > 0:
             self.frames = self.animation_R
         elif dx < 0:
             self.frames = self.animation_L
-        self.image = self.frames[self.animation_frame]
+        self.image = self.game.animation.image(self.frames)
+        self.dirty = 1
 
     def handle_pickups(self):
-        pickup = self.collide(self.game.layers["PICKUPS"])
+        pickup = self.collide(self.game.grid["PICKUPS"])
         if pickup:
             pickup_type = pickup.pick()
             if pickup_type == "coin":
@@ -98,86 +146,77 @@ class Player(pygame.sprite.Sprite):
                 self.key = True
 
     def handle_encounters(self, dx, dy):
-        enemy = self.collide(self.game.layers["ENEMIES"], dx, dy)
+        enemy = self.collide(self.game.grid["ENEMIES"], dx, dy)
         if enemy:
             enemy.hit(self)
 
     def heal(self, amount):
-        self.health += amount
-        if self.health > self.max_health:
-            self.health = self.max_health
+        self.health = min(self.health + amount, self.max_health)
 
     def hit(self, attacker):
-        hit_chance = attacker.accuracy - self.hit_resistance + BASE_HIT_CHANCE
-        if hit_chance < 0.1:
-            hit_chance = 0.1
-        if hit_chance > 1:
-            self.health -= attacker.damage
-        elif random.random() < hit_chance:
+        chance = hit_chance(attacker.accuracy, self.hit_resistance)
+        if chance > 1 or self.game.random.combat.random() < chance:
             self.health -= attacker.damage
         if self.health < 1:
             self.game.game_over()
             self.delete()
 
-    def collide(self, layer, dx=0, dy=0):
-        for sprite in layer:
-            if sprite.pos.x == self.pos.x + dx and sprite.pos.y == self.pos.y + dy:
-                return sprite
+    def collide(self, grid, dx=0, dy=0):
+        sprite = grid.get(self.pos.x + dx, self.pos.y + dy)
+        if sprite:
+            return sprite
         return False
 
     def delete(self):
+        self.game.grid["PLAYER"].remove(self)
         self.kill()
-        self.shadow.kill()
+        self.shadow.delete()
 
-class Enemy(pygame.sprite.Sprite):
+class Enemy(pygame.sprite.DirtySprite):
     def __init__(self, game, x, y, character_type):
-        self.groups = game.layers["ENEMIES"]
-        pygame.sprite.Sprite.__init__(self, self.groups)
+        pygame.sprite.DirtySprite.__init__(self)
         self.game = game
+        self.rect = pygame.Rect(0, 0, TILE_SIZE, TILE_SIZE)
+        self.pos = Vector(0, 0)
+        self.spawn(x, y, character_type)
+
+    def spawn(self, x, y, character_type):
+        self.add(self.game.layers["ENEMIES"])
         self.load_frames(character_type)
-        self.image = self.animation_R[0]
-        self.rect = self.image.get_rect()
-        self.pos = Vector(x, y)
-        self.shadow = Shadow(self.game, self)
+        self.image = self.game.animation.image(self.frames)
+        self.dirty = 1
+        self.pos.update(x, y)
+        self.rect.topleft = (x * TILE_SIZE, y * TILE_SIZE)
+        self.game.grid["ENEMIES"].add(self)
+        self.shadow = self.game.pool.acquire(Shadow, self)
         self.type = character_type
-        self.damage = ENEMY_STATS[character_type][0] + self.game.stage * 0.001
-        self.health = ENEMY_STATS[character_type][1] + self.game.stage * 0.001
-        self.hit_resistance = ENEMY_STATS[character_type][2] + self.game.stage * 0.001
-        self.accuracy = ENEMY_STATS[character_type][3] + self.game.stage * 0.001
+        self.damage, self.health, self.hit_resistance, self.accuracy = enemy_stats(character_type, self.game.stage).tolist()
 
     def load_frames(self, character_type):
-        self.animation_frame = 0
-        self.last_frame_time = 0
-        self.animation_R = [self.game.sprite_sheet.get_image(sprites) for sprites in ENEMY_ANIMATION_FRAMES[character_type]]
-        self.animation_L = [pygame.transform.flip(image, True, False) for image in self.animation_R]
-        self.frame_count = len(self.animation_R)
+        self.animation_frame = None
+        self.animation_R = self.game.sprite_sheet.get_frames(ENEMY_ANIMATION_FRAMES[character_type])
+        self.animation_L = self.game.sprite_sheet.get_frames(ENEMY_ANIMATION_FRAMES[character_type], True)
         self.frames = self.animation_R
 
     def update(self):
         self.animate()
-        self.rect.x = self.pos.x * SPRITE_SIZE
-        self.rect.y = self.pos.y * SPRITE_SIZE
+        self.rect.x = self.pos.x * TILE_SIZE
+        self.rect.y = self.pos.y * TILE_SIZE
         self.shadow.update()
 
     def animate(self):
-        now = pygame.time.get_ticks()
-        if now - self.last_frame_time > ANIMATION_INTERVAL:
-            self.last_frame_time = now
-            self.animation_frame = (self.animation_frame + 1) % self.frame_count
+        if self.animation_frame != self.game.animation.frame:
+            self.animation_frame = self.game.animation.frame
             if self.game.player.pos.x - self.pos.x > 0:
                 self.frames = self.animation_R
             else:
                 self.frames = self.animation_L
-            self.image = self.frames[self.animation_frame]
+            self.image = self.game.animation.image(self.frames)
+            self.dirty = 1
 
     def hit(self, attacker):
-        hit_chance = attacker.accuracy - self.hit_resistance + BASE_HIT_CHANCE
-        if hit_chance < 0.1:
-            hit_chance = 0.1
-        if hit_chance > 1:
-            self.health -= attacker.damage
-            self.game.sounds["HIT"][self.type].play()
-        elif random.random() < hit_chance:
+        chance = hit_chance(attacker.accuracy, self.hit_resistance)
+        if chance > 1 or self.game.random.combat.random() < chance:
             self.health -= attacker.damage
             self.game.sounds["HIT"][self.type].play()
         if self.health < 0.01:
@@ -187,77 +226,108 @@ class Enemy(pygame.sprite.Sprite):
         self.game.player.heal(self.game.player.lifesteal)
         attacker.hit(self)
 
+    def act(self):
+        behaviour = ENEMY_BEHAVIOURS[self.type]
+        if behaviour == "idle":
+            return
+        step = self.game.distance_field.step(self.pos.x, self.pos.y, behaviour == "flee")
+        if not step:
+            return
+        x = self.pos.x + step[0]
+        y = self.pos.y + step[1]
+        if self.game.grid["PLAYER"].get(x, y):
+            self.game.player.hit(self)
+        elif not self.game.grid["ENEMIES"].get(x, y) and not self.game.grid["PICKUPS"].get(x, y):
+            self.game.grid["ENEMIES"].move(self, x, y)
+
     def kill_bonus(self):
-        if self.type == 0:
-            self.game.player.heal(3)
-            self.game.player.lifesteal += 0.005
-        elif self.type == 1:
-            self.game.player.accuracy += 0.005
-        elif self.type == 2:
-            self.game.player.damage += 0.001
-        elif self.type == 3:
-            self.game.player.hit_resistance += 0.005
+        heal, lifesteal, accuracy, damage, hit_resistance = KILL_BONUS[self.type]
+        player = self.game.player
+        if heal:
+            player.heal(heal)
+        player.lifesteal += lifesteal
+        player.accuracy += accuracy
+        player.damage += damage
+        player.hit_resistance += hit_resistance
 
     def delete(self):
+        self.game.grid["ENEMIES"].remove(self)
         self.kill()
-        self.shadow.kill()
+        self.shadow.delete()
+        self.game.pool.release(self)
 
-class Shadow(pygame.sprite.Sprite):
+class Shadow(pygame.sprite.DirtySprite):
     def __init__(self, game, entity):
-        self.groups = game.layers["SHADOWS"]
-        pygame.sprite.Sprite.__init__(self, self.groups)
+        pygame.sprite.DirtySprite.__init__(self)
         self.game = game
-        self.entity = entity
         self.load_frames()
         self.image = self.frames[0]
         self.rect = self.image.get_rect()
+        self.spawn(entity)
+
+    def spawn(self, entity):
+        self.add(self.game.layers["SHADOWS"])
+        self.entity = entity
+        self.dirty = 1
+        self.update()
 
     def load_frames(self):
-        self.frames = [self.game.sprite_sheet.get_image(sprites) for sprites in SHADOW_FRAMES]
+        self.frames = self.game.sprite_sheet.get_frames(SHADOW_FRAMES)
         self.type = 1
 
     def update(self):
+        if self.entity is None:
+            return
         self.rect.x = self.entity.rect.x
-        self.rect.y = self.entity.rect.y + SPRITE_SIZE
+        self.rect.y = self.entity.rect.y + TILE_SIZE
+
+    def delete(self):
+        self.kill()
+        self.entity = None
+        self.game.pool.release(self)
 
-class Pickup(pygame.sprite.Sprite):
+class Pickup(pygame.sprite.DirtySprite):
     def __init__(self, game, x, y, pickup_type):
-        self.groups = game.layers["PICKUPS"]
-        pygame.sprite.Sprite.__init__(self, self.groups)
+        pygame.sprite.DirtySprite.__init__(self)
         self.game = game
+        self.rect = pygame.Rect(0, 0, TILE_SIZE, TILE_SIZE)
+        self.pos = Vector(0, 0)
+        self.spawn(x, y, pickup_type)
+
+    def spawn(self, x, y, pickup_type):
+        self.add(self.game.layers["PICKUPS"])
         self.type = pickup_type
         self.load_frames()
-        self.image = self.frames[0]
-        self.rect = self.image.get_rect()
-        self.pos = Vector(x, y)
-        self.shadow = Shadow(self.game, self)
+        self.image = self.game.animation.image(self.frames)
+        self.dirty = 1
+        self.pos.update(x, y)
+        self.rect.topleft = (x * TILE_SIZE, y * TILE_SIZE)
+        self.game.grid["PICKUPS"].add(self)
+        self.shadow = self.game.pool.acquire(Shadow, self)
 
     def load_frames(self):
-        self.animation_frame = 0
-        self.last_frame_time = 0
-        self.frames = [self.game.sprite_sheet.get_image(sprites) for sprites in PICKUP_ANIMATION_FRAMES[self.type]]
-        self.frame_count = len(self.frames)
+        self.animation_frame = self.game.animation.frame
+        self.frames = self.game.sprite_sheet.get_frames(PICKUP_ANIMATION_FRAMES[self.type])
 
     def animate(self):
-        now = pygame.time.get_ticks()
-        if now - self.last_frame_time > ANIMATION_INTERVAL:
-            self.last_frame_time = now
-            self.animation_frame = (self.animation_frame + 1) % self.frame_count
-            self.image = self.frames[self.animation_frame]
+        if self.animation_frame != self.game.animation.frame:
+            self.animation_frame = self.game.animation.frame
+            self.image = self.game.animation.image(self.frames)
+            self.dirty = 1
 
     def update(self):
         self.animate()
-        self.rect.x = self.pos.x * SPRITE_SIZE
-        self.rect.y = self.pos.y * SPRITE_SIZE
+        self.rect.x = self.pos.x * TILE_SIZE
+        self.rect.y = self.pos.y * TILE_SIZE
 
     def change_type(self, pickup_type):
         self.type = pickup_type
         self.load_frames()
-        self.image = self.frames[0]
+        self.image = self.game.animation.image(self.frames)
+        self.dirty = 1
 
     def pick(self):
-        self.kill()
-        self.shadow.kill()
+        self.delete()
         if self.type == 0:
             self.game.sounds["COIN"].play()
             return "coin"
@@ -266,79 +336,46 @@ class Pickup(pygame.sprite.Sprite):
             return "key"
 
     def delete(self):
+        self.game.grid["PICKUPS"].remove(self)
         self.kill()
-        self.shadow.kill()
+        self.shadow.delete()
+        self.game.pool.release(self)
 
-class Wall(pygame.sprite.Sprite):
-    def __init__(self, game, x, y, wall_type):
-        self.groups = game.layers["WALLS"]
-        pygame.sprite.Sprite.__init__(self, self.groups)
-        self.game = game
-        self.type = wall_type
-        self.load_frames()
-        self.image = self.frames[0]
-        self.rect = self.image.get_rect()
-        self.pos = Vector(x, y)
-        self.rect.topleft = self.pos * SPRITE_SIZE
-
-    def load_frames(self):
-        self.frames = [self.game.sprite_sheet.get_image(sprites) for sprites in WALL_FRAMES[self.type]]
-
-    def update_sprite(self, ID):
-        self.image = self.frames[ID]
-
-    def change_type(self, wall_type):
-        self.type = wall_type
-        self.load_frames()
-        self.image = self.frames[0]
-
-    def delete(self):
-        self.kill()
-
-    def interact(self):
-        if self.type != 1:
-            return
-        else:
-            self.game.new_level()
-
-class Floor(pygame.sprite.Sprite):
-    def __init__(self, game, x, y, floor_type=False):
-        self.groups = game.layers["FLOOR"]
-        pygame.sprite.Sprite.__init__(self, self.groups)
-        self.game = game
-        self.load_frames()
-        if floor_type:
-            self.floor_type = floor_type
-        else:
-            self.floor_type = random.randint(0, 2)
-        self.image = self.frames[self.floor_type]
-        self.rect = self.image.get_rect()
-        self.pos = Vector(x, y)
-        self.rect.topleft = self.pos * SPRITE_SIZE
-
-    def load_frames(self):
-        self.frames = [self.game.sprite_sheet.get_image(sprites) for sprites in FLOOR_FRAMES]
-
-    def delete(self):
-        self.kill()
-
-class UserInterface(pygame.sprite.Sprite):
+class UserInterface(pygame.sprite.DirtySprite):
     def __init__(self, game):
         self.groups = game.layers["UI"]
-        pygame.sprite.Sprite.__init__(self, self.groups)
+        pygame.sprite.DirtySprite.__init__(self, self.groups)
         self.game = game
         self.offset = int(SPRITE_SIZE / 4)
         self.image = pygame.Surface((SCREEN_WIDTH, SPRITE_SIZE + self.offset * 2))
         self.rect = self.image.get_rect()
         self.pos = Vector(0, 0)
+        self.glyphs = {}
+        self.stale = True
         self.load_frames()
+        self.game.player.watchers.append(self.invalidate)
 
     def load_frames(self):
-        self.health = [self.game.sprite_sheet.get_image(sprite) for sprite in UI_HEALTH]
-        self.key = self.game.sprite_sheet.get_image(UI_KEY)
-        self.coin = self.game.sprite_sheet.get_image(UI_COIN)
+        self.health = self.game.ui_sheet.get_frames(UI_HEALTH)
+        self.key = self.game.ui_sheet.get_image(UI_KEY)
+        self.coin = self.game.ui_sheet.get_image(UI_COIN)
+
+    def invalidate(self, stat=None):
+        self.stale = True
+
+    def render_text(self, value):
+        text = str(value)
+        if text not in self.glyphs:
+            self.glyphs[text] = self.game.font.render(text, False, WHITE, BLACK)
+        return self.glyphs[text]
 
     def update(self):
+        if self.stale:
+            self.compose()
+
+    def compose(self):
+        self.stale = False
+        self.dirty = 1
         self.image.fill(BLACK)
         for i in range(0, int(self.game.player.max_health / 3)):
             health_bit = int(self.game.player.health - i * 3)
@@ -350,5 +387,5 @@ class UserInterface(pygame.sprite.Sprite):
         if self.game.player.key:
             self.image.blit(self.key, (SCREEN_WIDTH - SPRITE_SIZE - self.offset, self.offset / 2))
         self.image.blit(self.coin, (self.offset + SPRITE_SIZE * 8, self.offset))
-        text = self.game.font.render(str(self.game.player.coins), False, WHITE, BLACK)
+        text = self.render_text(self.game.player.coins)
         self.image.blit(text, (self.offset + SPRITE_SIZE * 9 + self.offset, self.offset + self.offset / 4))
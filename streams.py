@@ -0,0 +1,20 @@
+import numpy as np
+
+GENERATION = 0
+COMBAT = 1
+COSMETICS = 2
+
+class RandomStreams:
+    def __init__(self, seed=None):
+        self.seed = np.random.SeedSequence(seed).entropy
+        self.combat = self.stream(COMBAT)
+        self.cosmetics = self.stream(COSMETICS)
+
+    def stream(self, subsystem, *key):
+        return np.random.default_rng(np.random.SeedSequence(self.seed, spawn_key=(subsystem,) + key))
+
+    def level_seed(self, stage):
+        return np.random.SeedSequence(self.seed, spawn_key=(GENERATION, stage))
+
+    def candidate_seeds(self, stage, count):
+        return [self.level_seed(stage)] + [np.random.SeedSequence(self.seed, spawn_key=(GENERATION, stage, candidate)) for candidate in range(1, count)]
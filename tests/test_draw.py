@@ -0,0 +1,11 @@
+from render import merge_rects
+import pygame
+
+def test_merge_rects_joins_overlaps_transitively():
+    rects = [pygame.Rect(0, 0, 10, 10), pygame.Rect(30, 0, 10, 10), pygame.Rect(5, 5, 10, 10), pygame.Rect(14, 0, 20, 4)]
+    merged = merge_rects(rects)
+    assert merged == [pygame.Rect(0, 0, 40, 15)]
+
+def test_merge_rects_keeps_separate_rects():
+    rects = [pygame.Rect(0, 0, 10, 10), pygame.Rect(20, 20, 10, 10), pygame.Rect(0, 0, 10, 10)]
+    assert sorted(map(tuple, merge_rects(rects))) == [(0, 0, 10, 10), (20, 20, 10, 10)]
@@ -0,0 +1,21 @@
+from dungeon import DungeonGenerator
+import numpy as np
+import pytest
+
+def generate(vectorized, seed, steps, stage):
+    generator = DungeonGenerator()
+    generator.vectorized = vectorized
+    generator.max_steps = steps
+    return generator.generate(seed, stage)
+
+@pytest.mark.parametrize("steps", [50, 300, 1000])
+@pytest.mark.parametrize("seed", range(8))
+def test_vectorized_generator_matches_scalar(seed, steps):
+    stage = seed % 3
+    scalar = generate(False, seed, steps, stage)
+    vectorized = generate(True, seed, steps, stage)
+    for name in ("tiles", "wall_variant", "floor_variant"):
+        assert np.array_equal(getattr(scalar, name), getattr(vectorized, name)), name
+    assert (scalar.left, scalar.top) == (vectorized.left, vectorized.top)
+    assert scalar.pickups == vectorized.pickups
+    assert scalar.enemies == vectorized.enemies
@@ -0,0 +1,16 @@
+from fov import FieldOfView
+from main import Game
+import numpy as np
+
+def test_cached_view_marks_explored_after_reset():
+    game = Game(headless=True)
+    game.new(5)
+    level = game.level
+    x, y = int(game.player.pos.x), int(game.player.pos.y)
+    fov = FieldOfView()
+    fov.update(level, x, y)
+    explored = fov.explored.copy()
+    fov.update(level, x + 100, y)
+    fov.explored[:] = False
+    fov.update(level, x, y)
+    assert np.array_equal(fov.explored, explored)
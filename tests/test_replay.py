@@ -0,0 +1,23 @@
+from main import Game
+from replay import Replay
+from settings import *
+import pytest
+
+@pytest.mark.parametrize("move", [(0, 0), (1, 1), (-1, 1), (2, 0)])
+def test_move_rejects_anything_but_a_direction(move):
+    game = Game(headless=True)
+    game.new(11)
+    before = game.state()
+    with pytest.raises(ValueError):
+        game.move(*move)
+    assert game.state() == before
+    assert game.replay.moves == []
+
+def test_replay_reproduces_recorded_moves():
+    game = Game(headless=True)
+    game.new(11)
+    for turn in range(40):
+        state = game.move(*DIRECTIONS[turn * 7 % 5 % 4])
+    replay = Replay.decode(game.replay.encode())
+    assert replay.moves == game.replay.moves
+    assert replay.play(Game(headless=True)) == state
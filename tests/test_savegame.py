@@ -0,0 +1,48 @@
+from main import Game
+import numpy as np
+
+def snapshot(game):
+    state = game.state()
+    state["tiles"] = game.level.tiles.tobytes()
+    state["explored"] = np.asarray(game.fov.explored).tobytes()
+    state["enemies"] = sorted((int(enemy.pos.x), int(enemy.pos.y), enemy.health) for enemy in game.grid["ENEMIES"])
+    state["pickups"] = sorted((int(pickup.pos.x), int(pickup.pos.y), pickup.type) for pickup in game.grid["PICKUPS"])
+    return state
+
+def test_save_load_round_trip(tmp_path):
+    filename = str(tmp_path / "quicksave.sav")
+    game = Game(headless=True)
+    game.new(7)
+    for dx, dy in [(1, 0), (0, 1), (-1, 0), (0, -1)] * 3:
+        game.move(dx, dy)
+        game.update()
+    game.save_game(filename)
+    saved = snapshot(game)
+    game.load_game(filename)
+    assert snapshot(game) == saved
+
+    game.move(1, 0)
+    game.update()
+    game.save_game(filename)
+    moved = snapshot(game)
+    game.load_game(filename)
+    assert snapshot(game) == moved
+    assert game.replay.moves[-1] == 1
+
+def test_streamed_save_restores_the_world(tmp_path, monkeypatch):
+    import main
+    monkeypatch.setattr(main, "STREAMED_LEVELS", True)
+    filename = str(tmp_path / "quicksave.sav")
+    game = Game(headless=True)
+    game.new(4)
+    for turn in range(400):
+        game.move(*[(1, 0), (1, 0), (0, 1), (0, -1)][turn % 4])
+        game.update()
+    game.save_game(filename)
+    saved = snapshot(game)
+    expected = [game.move(0, -1) for turn in range(60)]
+    game.load_game(filename)
+    assert type(game.level).__name__ == "StreamedLevel"
+    assert snapshot(game) == saved
+    assert [game.move(0, -1) for turn in range(60)] == expected
+    assert game.level.in_bounds(game.player.pos.x, game.player.pos.y)
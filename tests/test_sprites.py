@@ -0,0 +1,15 @@
+from main import Game
+
+def test_player_notifies_watchers_only_on_change():
+    game = Game(headless=True)
+    game.new(3)
+    player = game.player
+    changes = []
+    player.watchers.append(changes.append)
+    player.heal(0)
+    player.health = player.health
+    player.heal(player.max_health)
+    assert changes == []
+    player.health -= 1
+    player.heal(5)
+    assert changes == ["health", "health"]
@@ -0,0 +1,23 @@
+from quality import flood
+from settings import *
+from world import World
+import numpy as np
+
+BLOCK = 6
+
+def test_chunks_connect_through_their_doors():
+    centre = CHUNK_SIZE // 2
+    for seed in range(20):
+        world = World(seed)
+        tiles = np.block([[world.tiles(cx, cy)[0] for cx in range(BLOCK)] for cy in range(BLOCK)])
+        distances = flood(tiles == TILE_FLOOR, (centre, centre))
+        for cy in range(BLOCK):
+            for cx in range(BLOCK):
+                left, top = cx * CHUNK_SIZE, cy * CHUNK_SIZE
+                assert distances[top + centre, left + centre] >= 0, (seed, cx, cy)
+                if cx:
+                    door = world.door(0, cx, cy)
+                    assert distances[top + door, left] >= 0 and distances[top + door, left - 1] >= 0, (seed, cx, cy)
+                if cy:
+                    door = world.door(1, cx, cy)
+                    assert distances[top, left + door] >= 0 and distances[top - 1, left + door] >= 0, (seed, cx, cy)
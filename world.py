@@ -0,0 +1,179 @@
+from dungeon import NEIGHBOUR_OFFSETS, shifted_neighbours
+from savegame import PICKUP_DTYPE, ENEMY_DTYPE
+from collections import OrderedDict
+from combat import enemy_stats
+from spatial import scatter
+from level import Level, shift_grid
+from settings import *
+import numpy as np
+
+DOORS = 0
+FLOORS = 1
+FEATURES = 2
+
+def zigzag(n):
+    return 2 * n if n >= 0 else -2 * n - 1
+
+class World:
+    def __init__(self, seed, stage=0):
+        if not isinstance(seed, np.random.SeedSequence):
+            seed = np.random.SeedSequence(seed)
+        self.seed = seed
+        self.stage = stage
+        self.floor_type = 3
+        self.floors = OrderedDict()
+        self.chunks = OrderedDict()
+        self.store = {}
+
+    def cached(self, cache, key, build):
+        if key in cache:
+            cache.move_to_end(key)
+            return cache[key]
+        cache[key] = build(*key)
+        if len(cache) > STREAM_CHUNK_CACHE:
+            cache.popitem(last=False)
+        return cache[key]
+
+    def rng(self, *key):
+        return np.random.default_rng(np.random.SeedSequence(self.seed.entropy, spawn_key=tuple(self.seed.spawn_key) + key))
+
+    def door(self, axis, x, y):
+        return 1 + int(self.rng(DOORS, axis, zigzag(x), zigzag(y)).integers(CHUNK_SIZE - 2))
+
+    def floor(self, cx, cy):
+        return self.cached(self.floors, (cx, cy), self.build_floor)
+
+    def build_floor(self, cx, cy):
+        rng = self.rng(FLOORS, zigzag(cx), zigzag(cy))
+        floor = np.zeros((CHUNK_SIZE, CHUNK_SIZE), dtype=bool)
+        centre = (CHUNK_SIZE // 2, CHUNK_SIZE // 2)
+        doors = [
+            (self.door(1, cx, cy), 0),
+            (CHUNK_SIZE - 1, self.door(0, cx + 1, cy)),
+            (self.door(1, cx, cy + 1), CHUNK_SIZE - 1),
+            (0, self.door(0, cx, cy))
+        ]
+        for x, y in doors:
+            floor[y, x] = True
+            self.carve(floor, rng, (min(max(x, 1), CHUNK_SIZE - 2), min(max(y, 1), CHUNK_SIZE - 2)), centre)
+        self.carve(floor, rng, centre, steps=STREAM_CAVE_STEPS)
+        return floor
+
+    def carve(self, floor, rng, start, target=None, steps=0):
+        x, y = start
+        floor[y, x] = True
+        while (x, y) != target and (target or steps > 0):
+            for roll, pick in rng.random((CHUNK_SIZE, 2)).tolist():
+                if target and roll < STREAM_CORRIDOR_BIAS:
+                    if pick < 0.5 and x != target[0] or y == target[1]:
+                        x += 1 if target[0] > x else -1
+                    else:
+                        y += 1 if target[1] > y else -1
+                else:
+                    dx, dy = DIRECTIONS[int(pick * 4)]
+                    x = min(max(x + dx, 1), CHUNK_SIZE - 2)
+                    y = min(max(y + dy, 1), CHUNK_SIZE - 2)
+                floor[y, x] = True
+                steps -= 1
+                if (x, y) == target or not target and steps <= 0:
+                    break
+
+    def tiles(self, cx, cy):
+        return self.cached(self.chunks, (cx, cy), self.build_tiles)
+
+    def build_tiles(self, cx, cy):
+        floor = np.block([[self.floor(cx + dx, cy + dy) for dx in range(-1, 2)] for dy in range(-1, 2)])
+        size = floor.shape[0]
+        padded = np.pad(floor, 1)
+        near_floor = np.zeros_like(floor)
+        for dx, dy in NEIGHBOUR_OFFSETS:
+            near_floor |= padded[1 + dy:1 + dy + size, 1 + dx:1 + dx + size]
+        wall = near_floor & ~floor
+        top, right, bottom, left = shifted_neighbours(wall)
+        variant = (top + right * 2 + bottom * 4 + left * 8).astype(np.uint8)
+        exits = right & left & ~top & ~bottom & wall
+        walls = top.astype(np.uint8) + right + bottom + left
+        top, right, bottom, left = shifted_neighbours(floor)
+        corners = wall & (top | right | bottom | left)
+        inner = slice(CHUNK_SIZE, CHUNK_SIZE * 2)
+        floor, wall, variant, exits, walls, corners = (grid[inner, inner] for grid in (floor, wall, variant, exits, walls, corners))
+        tiles = np.full((CHUNK_SIZE, CHUNK_SIZE), TILE_EMPTY, dtype=np.uint8)
+        tiles[floor] = TILE_FLOOR
+        tiles[wall] = TILE_WALL
+        wall_variant = np.where(wall, variant, 0).astype(np.uint8)
+        floor_variant = np.full((CHUNK_SIZE, CHUNK_SIZE), NO_FLOOR, dtype=np.int8)
+        floor_variant[floor | corners] = self.floor_type
+        rng = self.rng(FEATURES, zigzag(cx), zigzag(cy))
+        candidates = np.argwhere(exits)
+        if len(candidates) and rng.random() < STREAM_EXIT_CHANCE:
+            y, x = candidates[0]
+            tiles[y, x] = TILE_EXIT
+            wall_variant[y, x] = 0
+        return tiles, wall_variant, floor_variant, walls
+
+    def generate_entities(self, cx, cy):
+        tiles, _, _, walls = self.tiles(cx, cy)
+        rng = self.rng(FEATURES, zigzag(cx), zigzag(cy), 1)
+        left, top = cx * CHUNK_SIZE, cy * CHUNK_SIZE
+        floor = tiles == TILE_FLOOR
+        coins = [(int(x) + left, int(y) + top) for y, x in np.argwhere(floor & (walls == 3))]
+        pickups = [(x, y, 0) for x, y in scatter(rng, coins, COIN_SPAWN_CHANCE, COIN_MIN_DISTANCE)]
+        if pickups and rng.random() < STREAM_KEY_CHANCE:
+            x, y, _ = pickups[-1]
+            pickups[-1] = (x, y, 1)
+        spawn = (CHUNK_SIZE // 2, CHUNK_SIZE // 2)
+        cells = [(int(x) + left, int(y) + top) for y, x in np.argwhere(floor & (walls == 0)) if (cx, cy, x, y) != (0, 0) + spawn]
+        chance = min(ENEMY_SPAWN_CHANCE + self.stage * ENEMY_SPAWN_CHANCE_PER_STAGE, ENEMY_SPAWN_CHANCE_MAX)
+        placed = scatter(rng, cells, chance, ENEMY_MIN_DISTANCE)
+        types = rng.integers(0, len(ENEMY_STATS), size=len(placed))
+        enemies = [(x, y, enemy_type) + tuple(enemy_stats(enemy_type, self.stage).tolist()) for (x, y), enemy_type in zip(placed, types.tolist())]
+        return np.array(pickups, dtype=PICKUP_DTYPE), np.array(enemies, dtype=ENEMY_DTYPE)
+
+    def entities(self, cx, cy):
+        if (cx, cy) in self.store:
+            pickups, enemies = self.store[(cx, cy)]
+            return np.frombuffer(pickups, dtype=PICKUP_DTYPE), np.frombuffer(enemies, dtype=ENEMY_DTYPE)
+        return self.generate_entities(cx, cy)
+
+    def keep_entities(self, cx, cy, pickups, enemies):
+        pickups = np.array(sorted(pickups), dtype=PICKUP_DTYPE)
+        enemies = np.array(sorted(enemies), dtype=ENEMY_DTYPE)
+        generated_pickups, generated_enemies = self.generate_entities(cx, cy)
+        if np.array_equal(pickups, np.sort(generated_pickups)) and np.array_equal(enemies, np.sort(generated_enemies)):
+            self.store.pop((cx, cy), None)
+        else:
+            self.store[(cx, cy)] = (pickups.tobytes(), enemies.tobytes())
+
+class StreamedLevel(Level):
+    def __init__(self, world, radius=STREAM_RADIUS):
+        self.world = world
+        self.radius = radius
+        size = (radius * 2 + 1) * CHUNK_SIZE
+        Level.__init__(self, 0, 0, size, size)
+        self.spawn = (CHUNK_SIZE // 2, CHUNK_SIZE // 2)
+        self.centre = None
+        self.resident = set()
+
+    def follow(self, x, y):
+        centre = (int(x) // CHUNK_SIZE, int(y) // CHUNK_SIZE)
+        if centre == self.centre:
+            return [], []
+        self.centre = centre
+        chunks = {(centre[0] + dx, centre[1] + dy) for dy in range(-self.radius, self.radius + 1) for dx in range(-self.radius, self.radius + 1)}
+        entered = sorted(chunks - self.resident)
+        dropped = sorted(self.resident - chunks)
+        self.resident = chunks
+        left = (centre[0] - self.radius) * CHUNK_SIZE
+        top = (centre[1] - self.radius) * CHUNK_SIZE
+        self.tiles = shift_grid(self.tiles, left - self.left, top - self.top, TILE_EMPTY)
+        self.wall_variant = shift_grid(self.wall_variant, left - self.left, top - self.top, 0)
+        self.floor_variant = shift_grid(self.floor_variant, left - self.left, top - self.top, NO_FLOOR)
+        self.left = left
+        self.top = top
+        for cx, cy in entered:
+            tiles, wall_variant, floor_variant, _ = self.world.tiles(cx, cy)
+            area = (slice(cy * CHUNK_SIZE - top, (cy + 1) * CHUNK_SIZE - top), slice(cx * CHUNK_SIZE - left, (cx + 1) * CHUNK_SIZE - left))
+            self.tiles[area] = tiles
+            self.wall_variant[area] = wall_variant
+            self.floor_variant[area] = floor_variant
+        return entered, dropped